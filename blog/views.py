@@ -1,19 +1,22 @@
 from django.views.generic import ListView, DetailView
+from core.cache import CachedPageMixin
 from .models import Post
 
 
-class BlogIndexView(ListView):
+class BlogIndexView(CachedPageMixin, ListView):
     template_name = "blog/index.html"
     context_object_name = "posts"
     paginate_by = 10
+    cache_generations = ("post",)
 
     def get_queryset(self):
         return Post.objects.filter(is_published=True).order_by("-published_at")
 
 
-class PostDetailView(DetailView):
+class PostDetailView(CachedPageMixin, DetailView):
     model = Post
     context_object_name = "post"
     template_name = "blog/detail.html"
     slug_field = "slug"
     slug_url_kwarg = "slug"
+    cache_generations = ("post",)
@@ -1,11 +1,17 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Author, Publisher, Genre, Tag, Book
+from .models import Author, Publisher, Genre, Tag, Book, ImportJob, StockMovement
+from . import inventory
+from .tasks import run_import_job
+from django.contrib import messages
+from django.contrib.admin import helpers
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
 from django.urls import path
 from django import forms
-from django.shortcuts import render, redirect
-import csv
+from django.shortcuts import get_object_or_404, render, redirect
 from io import TextIOWrapper
+import csv
 
 
 @admin.register(Author)
@@ -43,7 +49,7 @@ class BookAdmin(admin.ModelAdmin):
     search_fields = ("title", "isbn", "authors__name")
     filter_horizontal = ("authors", "genres", "tags")
     exclude = ("slug",)
-    actions = ["increase_stock_5", "decrease_stock_5"]
+    actions = ["adjust_stock", "increase_stock_5", "decrease_stock_5"]
 
     def cover_preview(self, obj):
         if obj.cover:
@@ -59,10 +65,38 @@ class BookAdmin(admin.ModelAdmin):
     class CsvImportForm(forms.Form):
         csv_file = forms.FileField()
 
+    class StockAdjustForm(forms.Form):
+        MODE_CHOICES = (("add", "Add (negative to remove)"), ("set", "Set to"))
+        mode = forms.ChoiceField(choices=MODE_CHOICES)
+        quantity = forms.IntegerField()
+        note = forms.CharField(max_length=255, required=False)
+
+        def clean(self):
+            data = super().clean()
+            if data.get("mode") == "set" and data.get("quantity") is not None and data["quantity"] < 0:
+                self.add_error("quantity", "Stock cannot be set below zero.")
+            return data
+
+    class StockTakeForm(forms.Form):
+        csv_file = forms.FileField()
+        note = forms.CharField(max_length=255, required=False)
+
     def get_urls(self):
         urls = super().get_urls()
         custom = [
             path("upload-csv/", self.admin_site.admin_view(self.upload_csv), name="catalog_book_upload_csv"),
+            path("stock-take/", self.admin_site.admin_view(self.stock_take), name="catalog_book_stock_take"),
+            path("import-jobs/<int:job_id>/", self.admin_site.admin_view(self.import_job), name="catalog_book_import_job"),
+            path(
+                "import-jobs/<int:job_id>/status/",
+                self.admin_site.admin_view(self.import_job_status),
+                name="catalog_book_import_job_status",
+            ),
+            path(
+                "import-jobs/<int:job_id>/errors.csv",
+                self.admin_site.admin_view(self.import_job_errors),
+                name="catalog_book_import_job_errors",
+            ),
         ]
         return custom + urls
 
@@ -71,70 +105,132 @@ class BookAdmin(admin.ModelAdmin):
         if request.method == "POST":
             form = self.CsvImportForm(request.POST, request.FILES)
             if form.is_valid():
-                f = TextIOWrapper(request.FILES["csv_file"].file, encoding="utf-8")
-                reader = csv.DictReader(f)
-                created = 0
-                for row in reader:
-                    title = row.get("title", "").strip()
-                    if not title:
-                        continue
-                    isbn = row.get("isbn", "").strip()
-                    price = row.get("price", "0").strip() or "0"
-                    stock = int(row.get("stock", "0") or 0)
-                    desc = row.get("description", "")
-                    pub_name = row.get("publisher", "").strip()
-                    author_names = [a.strip() for a in row.get("authors", row.get("author", "")).split(";") if a.strip()]
-                    genre_names = [g.strip() for g in row.get("genres", "").split(";") if g.strip()]
-                    tag_names = [t.strip() for t in row.get("tags", "").split(";") if t.strip()]
-
-                    publisher = None
-                    if pub_name:
-                        publisher, _ = Publisher.objects.get_or_create(name=pub_name)
-
-                    book, created_flag = Book.objects.get_or_create(isbn=isbn or None, defaults={
-                        "title": title,
-                        "description": desc,
-                        "price": price,
-                        "stock": stock,
-                        "publisher": publisher,
-                        "is_active": True,
-                    })
-                    if not created_flag:
-                        book.title = title or book.title
-                        book.description = desc or book.description
-                        book.price = price or book.price
-                        book.stock = stock
-                        if publisher:
-                            book.publisher = publisher
-                        book.save()
-                    # M2M
-                    for name in author_names:
-                        a, _ = Author.objects.get_or_create(name=name)
-                        book.authors.add(a)
-                    for name in genre_names:
-                        g, _ = Genre.objects.get_or_create(name=name)
-                        book.genres.add(g)
-                    for name in tag_names:
-                        t, _ = Tag.objects.get_or_create(name=name)
-                        book.tags.add(t)
-                    created += 1 if created_flag else 0
-                self.message_user(request, f"CSV processed. Created {created} new books.")
-                return redirect("..")
+                # Large files take minutes; a worker imports them while the page polls.
+                job = ImportJob.objects.create(file=request.FILES["csv_file"], created_by=request.user)
+                transaction.on_commit(lambda: run_import_job.delay(job.pk))
+                return redirect("admin:catalog_book_import_job", job_id=job.pk)
         else:
             form = self.CsvImportForm()
         context["form"] = form
         return render(request, "admin/catalog/book_upload.html", context)
 
+    def _job_status(self, job):
+        return {
+            "id": job.pk,
+            "status": job.status,
+            "rows": job.rows_processed,
+            "created": job.created_count,
+            "updated": job.updated_count,
+            "errors": job.error_count,
+            "rows_per_second": round(job.rows_per_second),
+            "message": job.message,
+            "finished": job.status in ("done", "failed"),
+        }
+
+    def import_job(self, request, job_id):
+        job = get_object_or_404(ImportJob, pk=job_id)
+        context = {
+            **self.admin_site.each_context(request),
+            "title": f"CSV import #{job.pk}",
+            "job": job,
+            "status": self._job_status(job),
+        }
+        return render(request, "admin/catalog/book_import_job.html", context)
+
+    def import_job_status(self, request, job_id):
+        return JsonResponse(self._job_status(get_object_or_404(ImportJob, pk=job_id)))
+
+    def import_job_errors(self, request, job_id):
+        job = get_object_or_404(ImportJob, pk=job_id)
+        response = HttpResponse(content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="import-{job.pk}-errors.csv"'
+        writer = csv.writer(response)
+        writer.writerow(["row", "error"])
+        writer.writerows(job.errors.values_list("row_number", "message"))
+        return response
+
+    def stock_take(self, request):
+        context = {**self.admin_site.each_context(request), "title": "Apply a stock-take"}
+        if request.method == "POST":
+            form = self.StockTakeForm(request.POST, request.FILES)
+            if form.is_valid():
+                f = TextIOWrapper(request.FILES["csv_file"].file, encoding="utf-8")
+                result = inventory.apply_stock_take(f, note=form.cleaned_data["note"], user=request.user)
+                self.message_user(request, f"Stock-take applied. {result.summary()}")
+                for row_number, error in result.errors[:10]:
+                    self.message_user(request, f"Row {row_number}: {error}", level=messages.WARNING)
+                return redirect("admin:catalog_book_changelist")
+        else:
+            form = self.StockTakeForm()
+        context["form"] = form
+        return render(request, "admin/catalog/book_stock_take.html", context)
+
+    def adjust_stock(self, request, queryset):
+        if "apply" in request.POST:
+            form = self.StockAdjustForm(request.POST)
+            if form.is_valid():
+                data = form.cleaned_data
+                ids = list(queryset.values_list("pk", flat=True))
+                if data["mode"] == "set":
+                    changed = inventory.adjust_stock(ids, absolute=data["quantity"], note=data["note"], user=request.user)
+                else:
+                    changed = inventory.adjust_stock(ids, delta=data["quantity"], note=data["note"], user=request.user)
+                self.message_user(request, f"Adjusted stock for {len(changed)} of {len(ids)} selected books.")
+                return None
+        else:
+            form = self.StockAdjustForm()
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Adjust stock",
+            "form": form,
+            "queryset": queryset,
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            "opts": self.model._meta,
+        }
+        return render(request, "admin/catalog/book_adjust_stock.html", context)
+    adjust_stock.short_description = "Adjust stock of selected books"
+
     def increase_stock_5(self, request, queryset):
-        for b in queryset:
-            b.stock = (b.stock or 0) + 5
-            b.save(update_fields=["stock"])
+        inventory.adjust_stock(queryset.values_list("pk", flat=True), delta=5, user=request.user)
         self.message_user(request, "Increased stock by 5 for selected books.")
 
     def decrease_stock_5(self, request, queryset):
-        for b in queryset:
-            b.stock = max(0, (b.stock or 0) - 5)
-            b.save(update_fields=["stock"])
+        inventory.adjust_stock(queryset.values_list("pk", flat=True), delta=-5, user=request.user)
         self.message_user(request, "Decreased stock by 5 for selected books.")
     increase_stock_5.short_description = "Increase stock by 5"
     decrease_stock_5.short_description = "Decrease stock by 5"
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ("book", "delta", "reason", "reference", "user", "created_at")
+    list_filter = ("reason", "created_at")
+    search_fields = ("book__title", "book__isbn", "reference", "note")
+    readonly_fields = ("book", "delta", "reason", "reference", "note", "user", "created_at")
+    date_hierarchy = "created_at"
+
+    # The ledger is append-only.
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "status", "rows_processed", "created_count", "updated_count", "error_count", "created_by", "created_at")
+    list_filter = ("status", "created_at")
+    readonly_fields = (
+        "file", "status", "created_by", "rows_processed", "created_count", "updated_count", "error_count",
+        "last_row", "message", "started_at", "finished_at",
+    )
+    actions = ["resume"]
+
+    def resume(self, request, queryset):
+        # The task itself refuses jobs another worker is still running.
+        job_ids = list(queryset.exclude(status="done").values_list("pk", flat=True))
+        for job_id in job_ids:
+            run_import_job.delay(job_id)
+        self.message_user(request, f"Queued {len(job_ids)} imports.")
+    resume.short_description = "Resume selected imports"
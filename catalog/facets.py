@@ -0,0 +1,203 @@
+"""Facet counts for the catalog filters.
+
+Each facet is counted against the catalog filtered by every *other* active
+filter, so picking a genre still shows how many books the other genres
+would give. Genres and authors each take one grouped query; price buckets
+and availability share a single conditional aggregate.
+
+Searches are different: their hits come from the in-memory index, and
+sending thousands of ids to every facet query costs more than the counting.
+``search_facets`` filters the hits and counts every facet in one pass over a
+per-worker table of what the facets need for each active book, rebuilt
+whenever the book, author or genre generation moves.
+"""
+import threading
+from collections import Counter, namedtuple
+from decimal import Decimal
+
+from django.db.models import Count, Q
+
+from core.cache import get_generations
+
+from .models import Author, Book, Genre
+
+# (label, min, max) with inclusive bounds, matching the min/max filter.
+PRICE_BUCKETS = [
+    ("Under GH₵ 50", None, "49.99"),
+    ("GH₵ 50 – 99.99", "50", "99.99"),
+    ("GH₵ 100 – 199.99", "100", "199.99"),
+    ("GH₵ 200 and up", "200", None),
+]
+AUTHOR_FACET_LIMIT = 30
+
+
+def price_q(price_min=None, price_max=None):
+    q = Q()
+    if price_min is not None:
+        q &= Q(price__gte=price_min)
+    if price_max is not None:
+        q &= Q(price__lte=price_max)
+    return q
+
+
+def genre_facets(books):
+    """Every genre with its count; there are few enough to list them all."""
+    return list(
+        Genre.objects.annotate(count=Count("books", filter=Q(books__in=books)))
+        .order_by("name")
+        .values("slug", "name", "count")
+    )
+
+
+def author_facets(books, selected=None, limit=AUTHOR_FACET_LIMIT):
+    """The most common authors among ``books``, plus the selected one, by name."""
+    facets = list(
+        Author.objects.filter(books__in=books)
+        .annotate(count=Count("books"))
+        .order_by("-count", "name")
+        .values("slug", "name", "count")[:limit]
+    )
+    if selected and not any(a["slug"] == selected for a in facets):
+        author = Author.objects.filter(slug=selected).values("slug", "name").first()
+        if author:
+            # Outside the top ``limit``, not absent: count it the same way.
+            author["count"] = Author.objects.filter(slug=selected, books__in=books).count()
+            facets.append(author)
+    return sorted(facets, key=lambda a: a["name"])
+
+
+def price_and_availability_facets(books, active_price_q, active_avail_q):
+    """Count price buckets and stock states in one aggregate over ``books``.
+
+    ``books`` must not carry the price or availability filters; they are
+    re-applied here so each facet ignores only its own filter.
+    """
+    aggregates = {}
+    for i, (_, low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f"price_{i}"] = Count("pk", filter=price_q(low, high) & active_avail_q)
+    aggregates["in"] = Count("pk", filter=Q(stock__gt=0) & active_price_q)
+    aggregates["out"] = Count("pk", filter=Q(stock__lte=0) & active_price_q)
+    counts = books.order_by().aggregate(**aggregates)
+
+    price = [
+        {"label": label, "min": low or "", "max": high or "", "count": counts[f"price_{i}"]}
+        for i, (label, low, high) in enumerate(PRICE_BUCKETS)
+    ]
+    return price, {"in": counts["in"], "out": counts["out"]}
+
+
+FacetRow = namedtuple("FacetRow", ["price", "buckets", "in_stock", "genres", "authors"])
+FacetSnapshot = namedtuple("FacetSnapshot", ["version", "books", "genres", "authors"])
+SearchFacets = namedtuple("SearchFacets", ["matches", "genres", "authors", "price", "avail"])
+
+
+class FacetTable:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def get(self):
+        version = get_generations("book", "author", "genre")
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._build(version)
+            return self._snapshot
+
+    def _build(self, version):
+        links = {}
+        for through, column in ((Book.genres.through, "genre_id"), (Book.authors.through, "author_id")):
+            linked = links[column] = {}
+            for book_id, target in through.objects.filter(book__is_active=True).values_list("book_id", column).order_by():
+                linked.setdefault(book_id, []).append(target)
+        bounds = [(_bound(low), _bound(high)) for _, low, high in PRICE_BUCKETS]
+        books = {
+            pk: FacetRow(
+                price,
+                tuple(i for i, (low, high) in enumerate(bounds) if _within(price, low, high)),
+                stock > 0,
+                links["genre_id"].get(pk, ()),
+                links["author_id"].get(pk, ()),
+            )
+            for pk, price, stock in Book.objects.filter(is_active=True).values_list("pk", "price", "stock").order_by()
+        }
+        genres = list(Genre.objects.order_by("name").values_list("pk", "slug", "name"))
+        authors = {pk: (slug, name) for pk, slug, name in Author.objects.values_list("pk", "slug", "name")}
+        return FacetSnapshot(version, books, genres, authors)
+
+
+facet_table = FacetTable()
+
+
+def _bound(value):
+    return None if value is None else Decimal(value)
+
+
+def _within(price, low, high):
+    return (low is None or price >= low) and (high is None or price <= high)
+
+
+def search_facets(ranked_ids, genre=None, author=None, price_min=None, price_max=None, avail=None,
+                  limit=AUTHOR_FACET_LIMIT):
+    """Filter the search hits ``ranked_ids`` and count every facet, in one pass.
+
+    Returns the active hits passing every filter, in rank order, and the
+    facets in the shapes the functions above return.
+    """
+    table = facet_table.get()
+    genre_id = next((pk for pk, slug, _ in table.genres if slug == genre), None)
+    author_id = next((pk for pk, (slug, _) in table.authors.items() if slug == author), None) if author else None
+    in_stock = avail == "in"
+
+    matches = []
+    genre_counts, author_counts, price_counts, avail_counts = Counter(), Counter(), Counter(), Counter()
+    for pk in ranked_ids:
+        row = table.books.get(pk)
+        if row is None:
+            continue
+        # The one filter this book fails, if any; failing two rules it out everywhere.
+        failed = None
+        for name, ok in (
+            ("genre", not genre or genre_id in row.genres),
+            ("author", not author or author_id in row.authors),
+            ("price", _within(row.price, price_min, price_max)),
+            ("avail", avail is None or row.in_stock == in_stock),
+        ):
+            if not ok:
+                if failed:
+                    break
+                failed = name
+        else:
+            # Each facet counts the books passing every filter but its own.
+            if failed is None:
+                matches.append(pk)
+            if failed in (None, "genre"):
+                for key in row.genres:
+                    genre_counts[key] += 1
+            if failed in (None, "author"):
+                for key in row.authors:
+                    author_counts[key] += 1
+            if failed in (None, "price"):
+                for key in row.buckets:
+                    price_counts[key] += 1
+            if failed in (None, "avail"):
+                avail_counts[row.in_stock] += 1
+
+    top = sorted(author_counts, key=lambda pk: (-author_counts[pk], table.authors[pk][1]))[:limit]
+    if author_id is not None and author_id not in top:
+        top.append(author_id)
+    return SearchFacets(
+        matches,
+        [{"slug": slug, "name": name, "count": genre_counts[pk]} for pk, slug, name in table.genres],
+        sorted(
+            ({"slug": table.authors[pk][0], "name": table.authors[pk][1], "count": author_counts[pk]} for pk in top),
+            key=lambda a: a["name"],
+        ),
+        [
+            {"label": label, "min": low or "", "max": high or "", "count": price_counts[i]}
+            for i, (label, low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        {"in": avail_counts[True], "out": avail_counts[False]},
+    )
@@ -0,0 +1,107 @@
+"""Resized WebP/AVIF derivatives of book covers.
+
+Each cover is decoded once and saved at every width in ``WIDTHS`` (never
+upscaled) as WebP, plus AVIF when Pillow has an AVIF encoder. File names
+are a hash of the original's bytes, so they can be cached forever and
+identical covers share files. The result is recorded on
+``Book.cover_variants``; the ``cover_image`` template tag reads only that
+field and emits ``srcset``, so rendering never touches storage.
+"""
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+try:
+    import pillow_avif  # type: ignore  # noqa: F401  (registers AVIF on older Pillow)
+except Exception:  # pragma: no cover
+    pass
+
+Image.init()
+WIDTHS = (160, 320, 480, 640, 960)
+FORMATS = {"webp": {"format": "WEBP", "quality": 80, "method": 4}}
+if "AVIF" in Image.SAVE:
+    FORMATS["avif"] = {"format": "AVIF", "quality": 55}
+DERIVED_DIR = "covers/derived"
+HASH_CHUNK = 64 * 1024
+# How ``reencode`` writes cleaned-up originals, by file extension.
+ORIGINAL_FORMATS = {
+    "jpg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+    "jpeg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+    "png": {"format": "PNG", "optimize": True},
+    "webp": {"format": "WEBP", "quality": 85, "method": 4},
+}
+
+
+def content_hash(fileobj):
+    """Short SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK), b""):
+        digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def derivative_name(digest, width, ext):
+    return f"{DERIVED_DIR}/{digest}-{width}.{ext}"
+
+
+def _encode(image, ext):
+    buf = io.BytesIO()
+    image.save(buf, **FORMATS[ext])
+    return buf.getvalue()
+
+
+def upright(image):
+    """Apply the EXIF orientation and drop to RGB, or RGBA when there is transparency."""
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def reencode(image, ext, fileobj):
+    """Write ``image`` to ``fileobj`` as ``ext`` with no metadata except its colour profile."""
+    options = dict(ORIGINAL_FORMATS[ext])
+    if options["format"] == "JPEG" and image.mode == "RGBA":
+        image = image.convert("RGB")
+    if image.info.get("icc_profile"):
+        options["icc_profile"] = image.info["icc_profile"]
+    image.save(fileobj, **options)
+
+
+def build_variants(image, digest, storage, source_name):
+    """Write every derivative of ``image`` (missing ones only) and return the manifest."""
+    image = upright(image)
+    # Smaller originals also get a copy at their own width, the sharpest available.
+    widths = [w for w in WIDTHS if w < image.width]
+    if image.width <= WIDTHS[-1]:
+        widths.append(image.width)
+    manifest = {"source": source_name, "hash": digest, "width": image.width}
+    for ext in FORMATS:
+        names = {}
+        for width in widths:
+            name = derivative_name(digest, width, ext)
+            if not storage.exists(name):
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                name = storage.save(name, ContentFile(_encode(resized, ext)))
+            names[str(width)] = name
+        manifest[ext] = names
+    return manifest
+
+
+def generate_variants(book):
+    """Build the derivatives of ``book.cover`` and return the manifest (None without a cover)."""
+    if not book.cover:
+        return None
+    storage = book.cover.storage
+    with storage.open(book.cover.name, "rb") as f:
+        digest = content_hash(f)
+        f.seek(0)
+        with Image.open(f) as image:
+            return build_variants(image, digest, storage, book.cover.name)
+
+
+def variants_current(book):
+    variants = book.cover_variants or {}
+    return bool(book.cover) and variants.get("source") == book.cover.name
@@ -0,0 +1,254 @@
+"""Batched CSV import for books.
+
+Rows are read as a stream and handled in chunks. Per chunk, publishers,
+authors, genres and tags are resolved through name -> id maps with one bulk
+insert for the missing names, books are upserted on ISBN with a single
+``bulk_create(update_conflicts=True)``, and M2M links are bulk-inserted
+into the through tables, all inside one transaction. A chunk costs a
+constant number of queries no matter how many rows it holds.
+
+Stock changes are recorded as ``StockMovement`` rows in the same
+transaction. Bulk writes skip model signals, so ``finish`` invalidates the search index,
+suggestion candidates, related books and cached pages once at the end.
+"""
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from core.cache import bump_generation
+
+from .models import Author, Book, Genre, Publisher, StockMovement, Tag
+from .related import rebuild_all, refresh_books
+from .search import search_index
+from .suggest import candidate_table
+
+CHUNK_SIZE = 1000
+BOOK_UPDATE_FIELDS = ["title", "description", "price", "stock", "publisher", "updated_at"]
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []  # (row_number, message)
+        self.book_ids = set()
+        # Set when resuming: earlier chunks' books are unknown, so refresh everything.
+        self.full_refresh = False
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (
+            f"Created {self.created}, updated {self.updated}, {len(self.errors)} errors "
+            f"({self.rows} rows, {self.rows_per_second:.0f} rows/s)."
+        )
+
+
+def _split(value):
+    return [part.strip() for part in (value or "").split(";") if part.strip()]
+
+
+def parse_row(row):
+    title = (row.get("title") or "").strip()
+    if not title:
+        raise RowError("missing title")
+    isbn = (row.get("isbn") or "").strip()
+    if not isbn:
+        raise RowError("missing isbn")
+    price = (row.get("price") or "").strip()
+    try:
+        price = Decimal(price) if price else None
+    except InvalidOperation:
+        raise RowError(f"invalid price {price!r}")
+    try:
+        stock = int(row.get("stock") or 0)
+    except ValueError:
+        raise RowError(f"invalid stock {row.get('stock')!r}")
+    if stock < 0:
+        raise RowError("negative stock")
+    return {
+        "title": title,
+        "isbn": isbn,
+        "price": price,
+        "stock": stock,
+        "description": row.get("description") or "",
+        "publisher": (row.get("publisher") or "").strip(),
+        "authors": _split(row.get("authors", row.get("author", ""))),
+        "genres": _split(row.get("genres")),
+        "tags": _split(row.get("tags")),
+    }
+
+
+def _unique_slug(base, taken):
+    slug, n = base, 2
+    while slug in taken:
+        slug = f"{base}-{n}"
+        n += 1
+    return slug
+
+
+def resolve_names(model, names):
+    """Return {name: pk}, bulk-inserting the names not in the table yet."""
+    names = set(names)
+    if not names:
+        return {}
+    found = dict(model.objects.filter(name__in=names).values_list("name", "pk"))
+    missing = names - found.keys()
+    if missing:
+        bases = {name: slugify(name) or model._meta.model_name for name in missing}
+        taken = set(model.objects.filter(slug__in=set(bases.values())).values_list("slug", flat=True))
+        objs = []
+        for name in sorted(missing):
+            slug = _unique_slug(bases[name], taken)
+            taken.add(slug)
+            objs.append(model(name=name, slug=slug))
+        model.objects.bulk_create(objs, ignore_conflicts=True)
+        found.update(model.objects.filter(name__in=missing).values_list("name", "pk"))
+        # A suffixed slug can still clash with an older row; fall back to save().
+        for name in missing - found.keys():
+            obj = model(name=name, slug=_unique_slug(f"{bases[name]}-{len(taken)}", taken))
+            obj.save()
+            found[name] = obj.pk
+    return found
+
+
+class BookImporter:
+    def __init__(self, chunk_size=CHUNK_SIZE, reference=""):
+        self.chunk_size = chunk_size
+        # Stored on the stock movements this import writes.
+        self.reference = reference
+
+    def run(self, fileobj, start_row=0, result=None, on_chunk=None):
+        """Import a CSV text stream and return an ``ImportResult``.
+
+        Rows numbered ``start_row`` or lower (the header is row 1) are skipped,
+        which lets an interrupted import resume after its last committed chunk.
+        ``on_chunk(last_row, result)`` runs inside each chunk's transaction, so
+        progress recorded there commits together with the chunk.
+        """
+        result = result or ImportResult()
+        rows = enumerate(csv.DictReader(fileobj), start=2)
+        if start_row:
+            rows = ((n, row) for n, row in rows if n > start_row)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                self.import_chunk(chunk, result)
+                if on_chunk:
+                    on_chunk(chunk[-1][0], result)
+        self.finish(result)
+        return result
+
+    def import_chunk(self, numbered_rows, result):
+        parsed = {}
+        for row_number, row in numbered_rows:
+            result.rows += 1
+            try:
+                data = parse_row(row)
+            except RowError as exc:
+                result.errors.append((row_number, str(exc)))
+                continue
+            # Last row wins for an ISBN repeated within the chunk.
+            parsed[data["isbn"]] = data
+        if not parsed:
+            return
+
+        with transaction.atomic():
+            publishers = resolve_names(Publisher, (d["publisher"] for d in parsed.values() if d["publisher"]))
+            authors = resolve_names(Author, (n for d in parsed.values() for n in d["authors"]))
+            genres = resolve_names(Genre, (n for d in parsed.values() for n in d["genres"]))
+            tags = resolve_names(Tag, (n for d in parsed.values() for n in d["tags"]))
+
+            # Locked so the stock movement recorded below matches the stock replaced.
+            existing = {
+                b.isbn: b
+                for b in Book.objects.select_for_update().filter(isbn__in=parsed).only(
+                    "pk", "isbn", "slug", "description", "price", "stock", "publisher_id"
+                )
+            }
+            new_bases = {isbn: slugify(d["title"]) or "book" for isbn, d in parsed.items() if isbn not in existing}
+            taken = set(Book.objects.filter(slug__in=set(new_bases.values())).values_list("slug", flat=True))
+
+            books = []
+            for isbn, d in parsed.items():
+                current = existing.get(isbn)
+                if current is None:
+                    slug = new_bases[isbn]
+                    if slug in taken:
+                        slug = _unique_slug(f"{slug}-{slugify(isbn)}", taken)
+                    taken.add(slug)
+                    price = d["price"] if d["price"] is not None else Decimal("0")
+                    publisher_id = publishers.get(d["publisher"])
+                    description = d["description"]
+                else:
+                    # Blank cells keep what the catalog already has.
+                    slug = current.slug
+                    price = d["price"] if d["price"] is not None else current.price
+                    publisher_id = publishers.get(d["publisher"]) or current.publisher_id
+                    description = d["description"] or current.description
+                books.append(Book(
+                    isbn=isbn, slug=slug, title=d["title"], description=description, price=price,
+                    stock=d["stock"], publisher_id=publisher_id, is_active=True,
+                ))
+            Book.objects.bulk_create(
+                books, update_conflicts=True, unique_fields=["isbn"], update_fields=BOOK_UPDATE_FIELDS
+            )
+            book_ids = dict(Book.objects.filter(isbn__in=parsed).values_list("isbn", "pk"))
+
+            for through, column, mapping, key in (
+                (Book.authors.through, "author_id", authors, "authors"),
+                (Book.genres.through, "genre_id", genres, "genres"),
+                (Book.tags.through, "tag_id", tags, "tags"),
+            ):
+                links = [
+                    through(book_id=book_ids[isbn], **{column: mapping[name]})
+                    for isbn, d in parsed.items()
+                    for name in d[key]
+                ]
+                through.objects.bulk_create(links, ignore_conflicts=True)
+
+            movements = []
+            for isbn, d in parsed.items():
+                current = existing.get(isbn)
+                delta = d["stock"] - (current.stock if current else 0)
+                if delta:
+                    movements.append(StockMovement(
+                        book_id=book_ids[isbn], delta=delta,
+                        reason="import" if current else "initial", reference=self.reference,
+                    ))
+            StockMovement.objects.bulk_create(movements)
+
+        result.created += len(parsed) - len(existing)
+        result.updated += len(existing)
+        result.book_ids.update(book_ids.values())
+
+    def finish(self, result):
+        result.finished = time.monotonic()
+        if not (result.book_ids or result.full_refresh):
+            return
+        search_index.invalidate()
+        candidate_table.invalidate()
+        if result.full_refresh or len(result.book_ids) > 100:
+            rebuild_all()
+        else:
+            refresh_books(result.book_ids)
+        bump_generation("book", "author", "publisher", "genre", "tag")
@@ -0,0 +1,208 @@
+"""Stock changes, the stock ledger and point-in-time stock levels.
+
+Adjustments touch many books with one ``UPDATE`` per batch instead of a
+``save()`` per book. The rows are locked (by a first ``UPDATE``) before
+their old stock is read, so a checkout running at the same time cannot
+slip in between the read and the write.
+
+Every path that changes ``Book.stock`` appends ``StockMovement`` rows in
+the same transaction. ``take_snapshot`` periodically materializes every
+book's level, so ``stock_at`` only has to add up the movements between
+the nearest snapshot and the requested moment.
+"""
+import csv
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from core.cache import bump_generation
+
+from .models import Book, StockMovement, StockSnapshot, StockSnapshotLine
+
+BATCH_SIZE = 500
+
+
+class StockTakeResult:
+    def __init__(self):
+        self.rows = 0
+        self.movements = []
+        self.errors = []  # (row_number, message)
+
+    def summary(self):
+        return f"Adjusted {len(self.movements)} books, {len(self.errors)} errors ({self.rows} rows)."
+
+
+def _apply(book_ids, stock_expr, new_stock, reason, note="", user=None):
+    """Set ``stock = stock_expr`` on ``book_ids`` and record the movements.
+
+    ``new_stock(pk, old)`` must compute in Python what ``stock_expr`` computes
+    in SQL; it is only used to fill in the ledger rows.
+    """
+    book_ids = sorted(set(book_ids))
+    if not book_ids:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        books = Book.objects.filter(pk__in=book_ids)
+        books.update(updated_at=now)
+        before = dict(books.values_list("pk", "stock"))
+        books.update(stock=stock_expr)
+        movements = [
+            StockMovement(book_id=pk, delta=new_stock(pk, old) - old, reason=reason, note=note, user=user)
+            for pk, old in before.items()
+            if new_stock(pk, old) != old
+        ]
+        StockMovement.objects.bulk_create(movements)
+        transaction.on_commit(lambda: bump_generation("book"))
+    return movements
+
+
+def adjust_stock(book_ids, delta=None, absolute=None, note="", user=None):
+    """Add ``delta`` to (never below zero) or set ``absolute`` on every book's stock."""
+    if (delta is None) == (absolute is None):
+        raise ValueError("Pass exactly one of delta or absolute")
+    if absolute is not None:
+        if absolute < 0:
+            raise ValueError("Stock cannot be negative")
+        return _apply(book_ids, Value(absolute), lambda pk, old: absolute, "adjustment", note, user)
+    return _apply(
+        book_ids,
+        Greatest(F("stock") + delta, Value(0), output_field=IntegerField()),
+        lambda pk, old: max(0, old + delta),
+        "adjustment", note, user,
+    )
+
+
+def apply_counts(counts, note="", user=None):
+    """Set each book's stock to its counted quantity, ``counts`` being {book_id: count}."""
+    movements = []
+    with transaction.atomic():
+        items = sorted(counts.items())
+        for start in range(0, len(items), BATCH_SIZE):
+            batch = dict(items[start:start + BATCH_SIZE])
+            expr = Case(
+                *[When(pk=pk, then=Value(count)) for pk, count in batch.items()],
+                default=F("stock"), output_field=IntegerField(),
+            )
+            movements += _apply(batch, expr, lambda pk, old: batch[pk], "stocktake", note, user)
+    return movements
+
+
+def release_stock(lines, reason="release", user=None):
+    """Put ``(book_id, quantity, reference)`` lines back on the shelf.
+
+    One ``UPDATE`` per batch of books; each line gets its own movement so the
+    ledger still points at the order it came from.
+    """
+    totals = {}
+    for book_id, quantity, _ in lines:
+        totals[book_id] = totals.get(book_id, 0) + quantity
+    if not totals:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        items = sorted(totals.items())
+        for start in range(0, len(items), BATCH_SIZE):
+            batch = dict(items[start:start + BATCH_SIZE])
+            Book.objects.filter(pk__in=batch).update(
+                stock=F("stock") + Case(
+                    *[When(pk=pk, then=Value(qty)) for pk, qty in batch.items()],
+                    default=Value(0), output_field=IntegerField(),
+                ),
+                updated_at=now,
+            )
+        movements = StockMovement.objects.bulk_create([
+            StockMovement(book_id=book_id, delta=quantity, reason=reason, reference=reference, user=user)
+            for book_id, quantity, reference in lines
+        ])
+        transaction.on_commit(lambda: bump_generation("book"))
+    return movements
+
+
+def apply_stock_take(fileobj, note="", user=None):
+    """Apply a stock-take CSV with ``isbn`` and ``count`` columns.
+
+    Rows with an unknown ISBN or a bad count are reported and skipped; the
+    rest are applied together.
+    """
+    result = StockTakeResult()
+    counts = {}
+    for row_number, row in enumerate(csv.DictReader(fileobj), start=2):
+        result.rows += 1
+        isbn = (row.get("isbn") or "").strip()
+        raw = (row.get("count") or row.get("quantity") or "").strip()
+        if not isbn:
+            result.errors.append((row_number, "missing isbn"))
+            continue
+        try:
+            count = int(raw)
+        except ValueError:
+            result.errors.append((row_number, f"invalid count {raw!r}"))
+            continue
+        if count < 0:
+            result.errors.append((row_number, "negative count"))
+            continue
+        counts[isbn] = (row_number, count)
+
+    ids = dict(Book.objects.filter(isbn__in=counts).values_list("isbn", "pk"))
+    for isbn, (row_number, _) in counts.items():
+        if isbn not in ids:
+            result.errors.append((row_number, f"unknown isbn {isbn}"))
+    result.errors.sort()
+    result.movements = apply_counts(
+        {ids[isbn]: count for isbn, (_, count) in counts.items() if isbn in ids}, note=note, user=user
+    )
+    return result
+
+
+def take_snapshot():
+    """Materialize every book's current stock and return the ``StockSnapshot``."""
+    with transaction.atomic():
+        # Written first so SQLite takes its write lock before anything is read.
+        snapshot = StockSnapshot.objects.create(taken_at=timezone.now())
+        # Holding the book rows means no stock change can commit between
+        # reading the levels and reading the ledger position.
+        levels = list(Book.objects.select_for_update().order_by("pk").values_list("pk", "stock"))
+        snapshot.last_movement_id = StockMovement.objects.aggregate(last=Max("pk"))["last"] or 0
+        snapshot.save(update_fields=["last_movement_id"])
+        StockSnapshotLine.objects.bulk_create(
+            [StockSnapshotLine(snapshot=snapshot, book_id=pk, stock=stock) for pk, stock in levels],
+            batch_size=BATCH_SIZE,
+        )
+    return snapshot
+
+
+def _totals(movements):
+    return movements.values("book_id").annotate(total=Sum("delta")).order_by().values_list("book_id", "total")
+
+
+def stock_at(when, book_ids=None):
+    """Return {book_id: stock} for every current book (or ``book_ids``) as of ``when``.
+
+    Starts from the latest snapshot taken at or before ``when`` and adds the
+    movements since; without one, works back from today's stock instead.
+    Books that did not exist yet count as 0.
+    """
+    books = Book.objects.all()
+    movements = StockMovement.objects.all()
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+        movements = movements.filter(book_id__in=book_ids)
+
+    snapshot = StockSnapshot.objects.filter(taken_at__lte=when).order_by("-taken_at").first()
+    if snapshot is None:
+        levels = dict(books.values_list("pk", "stock"))
+        for book_id, total in _totals(movements.filter(created_at__gt=when)):
+            if book_id in levels:
+                levels[book_id] -= total
+        return levels
+
+    lines = snapshot.lines.all() if book_ids is None else snapshot.lines.filter(book_id__in=book_ids)
+    snapshot_levels = dict(lines.values_list("book_id", "stock"))
+    levels = {pk: snapshot_levels.get(pk, 0) for pk in books.values_list("pk", flat=True)}
+    for book_id, total in _totals(movements.filter(pk__gt=snapshot.last_movement_id, created_at__lte=when)):
+        if book_id in levels:
+            levels[book_id] += total
+    return levels
@@ -0,0 +1,225 @@
+"""Rename, clean up and build derivatives for every book cover in parallel.
+
+Covers are handled in batches ordered by book id. For each batch a process
+pool first hashes every cover (streamed, never read whole), then handles
+each distinct image once. It re-encodes the image without metadata under
+the title-based name from ``book_cover_upload``, writes its WebP/AVIF
+derivatives, and stream-copies the result to any other book using the
+same image. The database is updated per batch and the last finished book
+id written to a checkpoint file, so an interrupted run picks up where it
+stopped.
+"""
+import json
+import os
+import posixpath
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from PIL import Image
+
+from catalog.images import ORIGINAL_FORMATS, build_variants, content_hash, reencode, upright
+from catalog.models import Book, book_cover_upload
+from core.cache import bump_generation
+
+DEFAULT_CHECKPOINT = ".process_covers.json"
+
+
+def _hash_cover(name):
+    if not default_storage.exists(name):
+        return name, None
+    with default_storage.open(name, "rb") as f:
+        return name, content_hash(f)
+
+
+def _put(name, fileobj):
+    """Store ``fileobj`` as exactly ``name``, replacing whatever is there."""
+    fileobj.seek(0)
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        path = None
+    if path:
+        # Write beside the target and rename over it, so a crash never leaves half a file.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(64 * 1024), b""):
+                out.write(chunk)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+        return name
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, File(fileobj))
+
+
+def _copy_into(name, out):
+    with default_storage.open(name, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            out.write(chunk)
+
+
+def _process_image(job):
+    """Clean up one distinct image and copy it to every book that uses it.
+
+    ``job`` is (digest, source_name, [(book_id, target_name), ...], manifest
+    currently on the first book, manifest of an earlier batch's copy or None).
+    Returns [(book_id, target_name, manifest)].
+    """
+    digest, source, targets, current, done = job
+    if done:
+        # Cleaned and derived in an earlier batch: only copy the cleaned file.
+        with tempfile.TemporaryFile() as cleaned:
+            _copy_into(done["source"], cleaned)
+            for book_id, target in targets:
+                if target != done["source"]:
+                    _put(target, cleaned)
+        return [(book_id, target, dict(done, source=target)) for book_id, target in targets]
+
+    already_clean = current.get("normalized") == digest
+    variants_digest = current.get("hash") if already_clean else digest
+
+    with tempfile.TemporaryFile() as cleaned:
+        with default_storage.open(source, "rb") as f, Image.open(f) as opened:
+            image = upright(opened)
+            first_target = targets[0][1]
+            ext = posixpath.splitext(first_target)[1].lstrip(".").lower()
+            if already_clean:
+                f.seek(0)
+                for chunk in iter(lambda: f.read(64 * 1024), b""):
+                    cleaned.write(chunk)
+            else:
+                reencode(image, ext, cleaned)
+            manifest = build_variants(image, variants_digest, default_storage, first_target)
+        cleaned.seek(0)
+        manifest["normalized"] = content_hash(cleaned)
+
+        results = []
+        for book_id, target in targets:
+            if not (already_clean and target == source):
+                _put(target, cleaned)
+            results.append((book_id, target, dict(manifest, source=target)))
+    return results
+
+
+class Command(BaseCommand):
+    help = "Rename, re-encode and strip metadata from book covers and rebuild their derivatives."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing anything.")
+        parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="File recording the last finished book id.")
+        parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first book.")
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        checkpoint = options["checkpoint"]
+        start = 0
+        if not options["restart"] and not self.dry_run and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                start = json.load(f)["last_book_id"]
+            self.stdout.write(f"Resuming after book {start}.")
+
+        # Cover names in use, so renames never take another book's file.
+        self.claimed = dict(Book.objects.exclude(cover="").values_list("cover", "pk"))
+        # digest -> manifest of the cleaned copy, to dedupe across batches.
+        self.done = {}
+        self.seen = set()
+        self.stats = defaultdict(int)
+        started = time.monotonic()
+        # Workers are forked; they must not inherit open database connections.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as pool:
+            while True:
+                batch = list(
+                    Book.objects.exclude(cover="").filter(pk__gt=start).order_by("pk")
+                    .values("pk", "title", "cover", "cover_variants")[:options["batch_size"]]
+                )
+                if not batch:
+                    break
+                self.process_batch(pool, batch)
+                start = batch[-1]["pk"]
+                if not self.dry_run:
+                    with open(checkpoint, "w") as f:
+                        json.dump({"last_book_id": start}, f)
+
+        if not self.dry_run:
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+            if self.stats["updated"]:
+                bump_generation("book")
+        elapsed = time.monotonic() - started
+        verb = "Would process" if self.dry_run else "Processed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {self.stats['books']} covers ({self.stats['images']} distinct images, "
+            f"{self.stats['duplicates']} duplicates, {self.stats['renamed']} renames, "
+            f"{self.stats['missing']} missing) in {elapsed:.1f}s."
+        ))
+
+    def target_name(self, book):
+        current = book["cover"]
+        ext = posixpath.splitext(current)[1].lower()
+        if ext.lstrip(".") not in ORIGINAL_FORMATS:
+            ext = ".jpg"
+        target = book_cover_upload(Book(title=book["title"]), f"cover{ext}")
+        owner = self.claimed.get(target)
+        if owner is not None and owner != book["pk"]:
+            stem, ext = posixpath.splitext(target)
+            target = f"{stem}-{book['pk']}{ext}"
+        return target
+
+    def process_batch(self, pool, batch):
+        hashes = dict(pool.map(_hash_cover, [b["cover"] for b in batch]))
+        groups = {}
+        for book in batch:
+            digest = hashes[book["cover"]]
+            self.stats["books"] += 1
+            if digest is None:
+                self.stats["missing"] += 1
+                self.stderr.write(f"Missing file for book {book['pk']}: {book['cover']}")
+                continue
+            target = self.target_name(book)
+            if target != book["cover"]:
+                self.stats["renamed"] += 1
+                if self.dry_run:
+                    self.stdout.write(f"{book['cover']} -> {target}")
+            self.claimed[target] = book["pk"]
+            if digest in self.seen:
+                self.stats["duplicates"] += 1
+            else:
+                self.seen.add(digest)
+                self.stats["images"] += 1
+            if digest in groups:
+                groups[digest][2].append((book["pk"], target))
+            else:
+                groups[digest] = (
+                    digest, book["cover"], [(book["pk"], target)], book["cover_variants"] or {}, self.done.get(digest)
+                )
+        if self.dry_run or not groups:
+            return
+
+        old_names = {b["pk"]: b["cover"] for b in batch}
+        updates = []
+        for digest, results in zip(groups, pool.map(_process_image, groups.values())):
+            self.done.setdefault(digest, results[0][2])
+            for book_id, target, manifest in results:
+                updates.append(Book(pk=book_id, cover=target, cover_variants=manifest))
+        with transaction.atomic():
+            Book.objects.bulk_update(updates, ["cover", "cover_variants"])
+        self.stats["updated"] += len(updates)
+
+        # Originals that were renamed away and no longer back any book.
+        in_use = {u.cover for u in updates}
+        stale = {old_names[u.pk] for u in updates} - in_use
+        still_used = set(Book.objects.filter(cover__in=stale).values_list("cover", flat=True))
+        for name in stale - still_used:
+            self.claimed.pop(name, None)
+            default_storage.delete(name)
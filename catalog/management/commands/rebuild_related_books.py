@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.related import rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized related-books table for every active book."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = rebuild_all(batch_size=options["batch_size"])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} related-book rows in {elapsed:.1f}s."))
@@ -0,0 +1,34 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from catalog.inventory import stock_at, take_snapshot
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = "Snapshot every book's stock, or with --at, print stock levels as of a past date."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--at", help="Date or datetime to report stock for (end of day for a date).")
+
+    def handle(self, *args, **options):
+        if not options["at"]:
+            snapshot = take_snapshot()
+            self.stdout.write(self.style.SUCCESS(f"Snapshot {snapshot.pk}: {snapshot.lines.count()} books."))
+            return
+
+        when = parse_datetime(options["at"])
+        if when is None:
+            day = parse_date(options["at"])
+            if day is None:
+                raise CommandError(f"Cannot parse {options['at']!r} as a date.")
+            when = datetime.combine(day, time.max)
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        levels = stock_at(when)
+        titles = dict(Book.objects.filter(pk__in=levels).values_list("pk", "title"))
+        for pk in sorted(levels, key=lambda pk: titles[pk]):
+            self.stdout.write(f"{levels[pk]:>6}  {titles[pk]}")
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_book_catalog_boo_title_41c535_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['updated_at'], name='catalog_boo_updated_7e9037_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_stockadjustment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RenameModel('StockAdjustment', 'StockMovement'),
+        migrations.RemoveField(model_name='stockmovement', name='previous_stock'),
+        migrations.RemoveField(model_name='stockmovement', name='new_stock'),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(db_index=True)),
+                ('last_movement_id', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-taken_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshotLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='reference',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='catalog.book'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reason',
+            field=models.CharField(choices=[('initial', 'Initial stock'), ('sale', 'Sale'), ('adjustment', 'Adjustment'), ('stocktake', 'Stock-take'), ('import', 'CSV import'), ('edit', 'Edited')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['book', 'created_at'], name='catalog_sto_book_id_10016b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['created_at'], name='catalog_sto_created_2e9d72_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshotline',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshotline',
+            name='snapshot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='catalog.stocksnapshot'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshotline',
+            constraint=models.UniqueConstraint(fields=('snapshot', 'book'), name='unique_snapshot_book'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_book_cover_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reason',
+            field=models.CharField(choices=[('initial', 'Initial stock'), ('sale', 'Sale'), ('adjustment', 'Adjustment'), ('stocktake', 'Stock-take'), ('import', 'CSV import'), ('edit', 'Edited'), ('release', 'Released (order cancelled)')], max_length=20),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.utils.text import slugify
 from django.urls import reverse
@@ -100,9 +101,14 @@ class Book(TimeStampedModel):
     isbn = models.CharField(max_length=20, unique=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     cover = models.ImageField(upload_to=book_cover_upload, blank=True)
+    # Resized WebP/AVIF copies of the cover, see catalog.images.
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
     stock = models.PositiveIntegerField(default=0)
     shelf_number = models.CharField(max_length=50, blank=True, help_text="Shelf location in the store")
     rating = models.FloatField(default=0.0)
+    # Approved reviews only; maintained by reviews.ratings.
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
     page_count = models.PositiveIntegerField(null=True, blank=True)
 
     is_active = models.BooleanField(default=True)
@@ -115,6 +121,8 @@ class Book(TimeStampedModel):
             models.Index(fields=["slug"]),
             models.Index(fields=["isbn"]),
             models.Index(fields=["title"]),
+            models.Index(fields=["title", "id"]),
+            models.Index(fields=["updated_at"]),
         ]
 
     def __str__(self):
@@ -134,8 +142,133 @@ class Book(TimeStampedModel):
         return reverse("catalog:detail", kwargs={"slug": self.slug})
 
 
+class RelatedBook(models.Model):
+    """Precomputed "related books" row, maintained by catalog.related."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="related_entries")
+    related = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="related_from")
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["book", "rank"]
+        unique_together = ("book", "related")
+        indexes = [
+            models.Index(fields=["book", "rank"]),
+        ]
+
+    def __str__(self):
+        return f"{self.book} -> {self.related} ({self.score})"
+
+
+class StockMovement(models.Model):
+    """Append-only ledger entry: one change to one book's stock.
+
+    Every path that changes ``Book.stock`` writes one, so the stock of any
+    book at any moment is the sum of its movements up to then.
+    """
+    REASON_CHOICES = (
+        ("initial", "Initial stock"),
+        ("sale", "Sale"),
+        ("adjustment", "Adjustment"),
+        ("stocktake", "Stock-take"),
+        ("import", "CSV import"),
+        ("edit", "Edited"),
+        ("release", "Released (order cancelled)"),
+    )
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="stock_movements")
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    # Order number, import job etc. that caused the movement.
+    reference = models.CharField(max_length=64, blank=True)
+    note = models.CharField(max_length=255, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["book", "created_at"]),
+            models.Index(fields=["created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.book}: {self.delta:+d} ({self.reason})"
+
+
+class StockSnapshot(models.Model):
+    """Every book's stock at ``taken_at``, covering movements up to ``last_movement_id``."""
+    taken_at = models.DateTimeField(db_index=True)
+    last_movement_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-taken_at"]
+
+    def __str__(self):
+        return f"Stock snapshot {self.taken_at:%Y-%m-%d %H:%M}"
+
+
+class StockSnapshotLine(models.Model):
+    snapshot = models.ForeignKey(StockSnapshot, on_delete=models.CASCADE, related_name="lines")
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    stock = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["snapshot", "book"], name="unique_snapshot_book")]
+
+
+class ImportJob(TimeStampedModel):
+    """A CSV import run in the background by catalog.tasks.run_import_job."""
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    )
+
+    file = models.FileField(upload_to="imports/")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # CSV row number (header = 1) of the last committed chunk; imports resume after it.
+    last_row = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.status})"
+
+    @property
+    def rows_per_second(self):
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or self.updated_at
+        seconds = (end - self.started_at).total_seconds()
+        return self.rows_processed / seconds if seconds > 0 else 0.0
+
+
+class ImportJobError(models.Model):
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name="errors")
+    row_number = models.PositiveIntegerField()
+    message = models.CharField(max_length=255)
+
+    class Meta:
+        ordering = ["row_number"]
+
+    def __str__(self):
+        return f"Row {self.row_number}: {self.message}"
+
+
 @receiver(post_delete, sender=Book)
 def delete_book_cover_file(sender, instance, **kwargs):
     """Delete the cover file from storage when a Book is deleted."""
     if instance.cover:
         instance.cover.delete(save=False)
+
@@ -0,0 +1,97 @@
+"""Keyset (cursor) pagination for the catalog listing.
+
+Pages are fetched with ``WHERE (title, id) > (last_title, last_id)`` instead
+of ``OFFSET``, so deep pages cost the same as the first. Cursors are opaque
+URL-safe tokens; the total shown alongside is cached per filter set.
+"""
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Q
+
+COUNT_CACHE_TIMEOUT = 300
+
+
+def encode_cursor(title, pk, direction):
+    raw = json.dumps([title, pk, direction], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """Return (title, pk, direction) or None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        title, pk, direction = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(title, str) or not isinstance(pk, int) or direction not in ("next", "prev"):
+        return None
+    return title, pk, direction
+
+
+def cached_count(queryset, params):
+    """Count ``queryset``, reusing the result for the same filters for a few minutes."""
+    digest = hashlib.md5(json.dumps(sorted(params.items())).encode("utf-8")).hexdigest()
+    key = f"catalog:count:{digest}"
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by().count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class KeysetPage:
+    """Page of books ordered by (title, id), with tokens for its neighbours."""
+
+    def __init__(self, object_list, has_next, has_previous, count=None):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.count = count
+        self.next_cursor = None
+        self.previous_cursor = None
+        if object_list and has_next:
+            last = object_list[-1]
+            self.next_cursor = encode_cursor(last.title, last.pk, "next")
+        if object_list and has_previous:
+            first = object_list[0]
+            self.previous_cursor = encode_cursor(first.title, first.pk, "prev")
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+
+def paginate_keyset(queryset, page_size, token):
+    cursor = decode_cursor(token)
+    if cursor is None:
+        rows = list(queryset.order_by("title", "pk")[: page_size + 1])
+        return KeysetPage(rows[:page_size], len(rows) > page_size, False)
+
+    title, pk, direction = cursor
+    if direction == "next":
+        rows = list(
+            queryset.filter(Q(title__gt=title) | Q(title=title, pk__gt=pk)).order_by("title", "pk")[: page_size + 1]
+        )
+        return KeysetPage(rows[:page_size], len(rows) > page_size, True)
+
+    rows = list(
+        queryset.filter(Q(title__lt=title) | Q(title=title, pk__lt=pk)).order_by("-title", "-pk")[: page_size + 1]
+    )
+    has_previous = len(rows) > page_size
+    return KeysetPage(list(reversed(rows[:page_size])), True, has_previous)
@@ -0,0 +1,172 @@
+"""Materialized related-books lists.
+
+A book's score against another is 3 per shared author, 2 per shared genre
+and 1 per shared tag. The top ``RELATED_LIMIT`` active books for each book
+are stored as ``RelatedBook`` rows so the detail page reads them with one
+indexed query. ``rebuild_all`` recomputes everything (see the
+``rebuild_related_books`` management command); ``schedule_refresh`` keeps the
+table current when a book's authors, genres or tags change.
+"""
+import heapq
+import threading
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from core.cache import bump_generation
+
+from .models import Book, RelatedBook
+
+RELATED_LIMIT = 8
+AUTHOR_WEIGHT = 3
+GENRE_WEIGHT = 2
+TAG_WEIGHT = 1
+
+_LINKS = (
+    (Book.authors.through, "author_id", AUTHOR_WEIGHT),
+    (Book.genres.through, "genre_id", GENRE_WEIGHT),
+    (Book.tags.through, "tag_id", TAG_WEIGHT),
+)
+
+_pending = threading.local()
+
+
+def overlap_scores(book_id):
+    """Return {other_book_id: score} for active books sharing anything with book_id."""
+    scores = Counter()
+    for through, column, weight in _LINKS:
+        shared = through.objects.filter(book_id=book_id).values(column)
+        rows = (
+            through.objects.filter(**{f"{column}__in": shared}, book__is_active=True)
+            .exclude(book_id=book_id)
+            .values("book_id")
+            .annotate(n=Count("pk"))
+            .order_by()
+        )
+        for row in rows:
+            scores[row["book_id"]] += weight * row["n"]
+    return scores
+
+
+def _pick_top(scores, info, limit=RELATED_LIMIT):
+    # Same ordering the detail page always used: score, then rating, then title.
+    ranked = heapq.nsmallest(limit, scores, key=lambda pk: (-scores[pk], -info[pk][0], info[pk][1]))
+    return [(pk, scores[pk]) for pk in ranked]
+
+
+def _book_info(book_ids):
+    return {
+        pk: (rating, title)
+        for pk, rating, title in Book.objects.filter(pk__in=book_ids).values_list("pk", "rating", "title")
+    }
+
+
+def _top_for(book_id, scores):
+    if not scores:
+        return []
+    # Only books tied with or above the cut-off score can make the list.
+    cutoff = sorted(scores.values(), reverse=True)[:RELATED_LIMIT][-1]
+    contenders = {pk: s for pk, s in scores.items() if s >= cutoff}
+    return _pick_top(contenders, _book_info(contenders))
+
+
+def _replace_rows(book_id, top):
+    RelatedBook.objects.filter(book_id=book_id).delete()
+    RelatedBook.objects.bulk_create([
+        RelatedBook(book_id=book_id, related_id=pk, score=score, rank=rank)
+        for rank, (pk, score) in enumerate(top)
+    ])
+
+
+def refresh_books(book_ids):
+    """Recompute the lists of the given books and of every list they can enter or leave."""
+    book_ids = set(book_ids)
+    active = set(Book.objects.filter(pk__in=book_ids, is_active=True).values_list("pk", flat=True))
+    affected = set()
+    with transaction.atomic():
+        for book_id in book_ids:
+            scores = overlap_scores(book_id) if book_id in active else {}
+            _replace_rows(book_id, _top_for(book_id, scores))
+
+            # Lists currently showing this book may need it dropped or re-scored.
+            affected.update(RelatedBook.objects.filter(related_id=book_id).values_list("book_id", flat=True))
+            if not scores:
+                continue
+            # Lists that are not full, or whose last entry this book now outranks, may
+            # gain it. Ties go by rating and title, as in ``_pick_top``.
+            rating, title = _book_info([book_id])[book_id]
+            weakest = {
+                other: (-score, -other_rating, other_title)
+                for other, score, other_rating, other_title in RelatedBook.objects.filter(
+                    book_id__in=list(scores), rank=RELATED_LIMIT - 1
+                ).values_list("book_id", "score", "related__rating", "related__title")
+            }
+            for other, score in scores.items():
+                if other not in weakest or (-score, -rating, title) < weakest[other]:
+                    affected.add(other)
+
+        for other in affected - book_ids:
+            _replace_rows(other, _top_for(other, overlap_scores(other)))
+
+
+def _flush_pending():
+    from .tasks import refresh_related_books
+
+    ids = getattr(_pending, "ids", None)
+    _pending.ids = set()
+    if ids:
+        refresh_related_books.delay(sorted(ids))
+
+
+def schedule_refresh(book_ids):
+    """Refresh in a worker after the current transaction commits, once per batch of changes.
+
+    Ids are collected per thread; each commit hook drains whatever is pending,
+    so an admin save that touches authors, genres and tags refreshes once.
+    """
+    pending = getattr(_pending, "ids", None)
+    if pending is None:
+        pending = _pending.ids = set()
+    pending.update(book_ids)
+    transaction.on_commit(_flush_pending)
+
+
+def rebuild_all(batch_size=1000):
+    """Recompute every book's list in memory from the three link tables.
+
+    Returns the number of rows written.
+    """
+    info = {
+        pk: (rating, title)
+        for pk, rating, title in Book.objects.filter(is_active=True).values_list("pk", "rating", "title")
+    }
+    members = defaultdict(list)
+    book_links = defaultdict(list)
+    for through, column, weight in _LINKS:
+        for book_id, target in through.objects.filter(book__is_active=True).values_list("book_id", column).order_by():
+            members[(column, target)].append(book_id)
+            book_links[book_id].append(((column, target), weight))
+
+    written = 0
+    with transaction.atomic():
+        RelatedBook.objects.all().delete()
+        batch = []
+        for book_id in info:
+            scores = Counter()
+            for key, weight in book_links.get(book_id, ()):
+                for other in members[key]:
+                    if other != book_id:
+                        scores[other] += weight
+            batch.extend(
+                RelatedBook(book_id=book_id, related_id=pk, score=score, rank=rank)
+                for rank, (pk, score) in enumerate(_pick_top(scores, info))
+            )
+            if len(batch) >= batch_size:
+                RelatedBook.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        RelatedBook.objects.bulk_create(batch)
+        written += len(batch)
+    transaction.on_commit(lambda: bump_generation("book"))
+    return written
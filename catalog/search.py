@@ -0,0 +1,183 @@
+"""In-process inverted index used by the catalog search box.
+
+Each worker keeps a token -> {book_id: weight} map over book titles, ISBNs,
+descriptions, author names and tag names. Signal handlers in
+``catalog.signals`` keep it current incrementally; a version counter in the
+shared cache tells other workers when their copy needs a rebuild.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .models import Book
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+VERSION_KEY = "catalog:search:version"
+
+# Field weights used for ranking; a title hit outranks a description hit.
+TITLE_WEIGHT = 5
+ISBN_WEIGHT = 5
+AUTHOR_WEIGHT = 3
+TAG_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def _load_documents(book_ids=None):
+    """Return {book_id: {token: weight}} using three flat queries."""
+    books = Book.objects.all()
+    author_links = Book.authors.through.objects.all()
+    tag_links = Book.tags.through.objects.all()
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+        author_links = author_links.filter(book_id__in=book_ids)
+        tag_links = tag_links.filter(book_id__in=book_ids)
+
+    docs = {}
+
+    def add(book_id, text, weight):
+        doc = docs.get(book_id)
+        if doc is None:
+            return
+        for token in set(tokenize(text)):
+            doc[token] = doc.get(token, 0) + weight
+
+    for pk, title, isbn, description in books.values_list("pk", "title", "isbn", "description").order_by():
+        docs[pk] = {}
+        add(pk, title, TITLE_WEIGHT)
+        add(pk, isbn, ISBN_WEIGHT)
+        add(pk, description, DESCRIPTION_WEIGHT)
+    for book_id, name in author_links.values_list("book_id", "author__name").order_by():
+        add(book_id, name, AUTHOR_WEIGHT)
+    for book_id, name in tag_links.values_list("book_id", "tag__name").order_by():
+        add(book_id, name, TAG_WEIGHT)
+    return docs
+
+
+def _current_version():
+    cache.add(VERSION_KEY, 1, timeout=None)
+    return cache.get(VERSION_KEY) or 1
+
+
+def _bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        return cache.incr(VERSION_KEY)
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._doc_tokens = {}
+        self._sorted_tokens = None
+        self._version = None
+
+    def rebuild(self):
+        version = _current_version()
+        docs = _load_documents()
+        with self._lock:
+            self._postings = {}
+            self._doc_tokens = {}
+            for book_id, tokens in docs.items():
+                self._add_doc(book_id, tokens)
+            self._sorted_tokens = None
+            self._version = version
+
+    def reindex_books(self, book_ids):
+        book_ids = set(book_ids)
+        if not book_ids:
+            return
+        docs = _load_documents(book_ids)
+        with self._lock:
+            for book_id in book_ids:
+                self._remove_doc(book_id)
+                if book_id in docs:
+                    self._add_doc(book_id, docs[book_id])
+            self._sorted_tokens = None
+            self._adopt(_bump_version())
+
+    def remove_books(self, book_ids):
+        with self._lock:
+            for book_id in book_ids:
+                self._remove_doc(book_id)
+            self._sorted_tokens = None
+            self._adopt(_bump_version())
+
+    def invalidate(self):
+        """Force every worker, including this one, to rebuild on next search."""
+        _bump_version()
+        with self._lock:
+            self._version = None
+
+    def search(self, query, limit=None):
+        """Return book IDs matching every query term, best match first.
+
+        Each term matches indexed tokens by prefix so partially typed words
+        still hit.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        if self._version is None or self._version != _current_version():
+            self.rebuild()
+        with self._lock:
+            scores = None
+            for term in dict.fromkeys(terms):
+                matched = defaultdict(int)
+                for token in self._expand(term):
+                    bonus = 1 if token == term else 0
+                    for book_id, weight in self._postings[token].items():
+                        matched[book_id] = max(matched[book_id], weight + bonus)
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {pk: score + matched[pk] for pk, score in scores.items() if pk in matched}
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [pk for pk, _ in ranked]
+
+    def _adopt(self, version):
+        # Only adopt the new version if nobody else changed the catalog in the
+        # meantime; otherwise the next search rebuilds from the database.
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+        else:
+            self._version = None
+
+    def _expand(self, term):
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        tokens = self._sorted_tokens
+        i = bisect_left(tokens, term)
+        while i < len(tokens) and tokens[i].startswith(term):
+            yield tokens[i]
+            i += 1
+
+    def _add_doc(self, book_id, tokens):
+        for token, weight in tokens.items():
+            self._postings.setdefault(token, {})[book_id] = weight
+        self._doc_tokens[book_id] = set(tokens)
+
+    def _remove_doc(self, book_id):
+        for token in self._doc_tokens.pop(book_id, ()):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(book_id, None)
+            if not posting:
+                del self._postings[token]
+
+
+search_index = SearchIndex()
@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from core.cache import bump_generation
+
+from .images import variants_current
+from .models import Author, Book, Genre, RelatedBook, StockMovement, Tag
+from .related import schedule_refresh
+from .search import search_index
+from .suggest import candidate_table
+
+
+def _reindex(book_ids):
+    search_index.reindex_books(book_ids)
+    # Cached catalog pages must not be rebuilt from the index before it caught up.
+    bump_generation("book")
+
+
+def _reindex_later(book_ids):
+    book_ids = set(book_ids)
+    if book_ids:
+        transaction.on_commit(lambda: _reindex(book_ids))
+        transaction.on_commit(candidate_table.invalidate)
+
+
+def _invalidate_later():
+    transaction.on_commit(search_index.invalidate)
+    transaction.on_commit(candidate_table.invalidate)
+
+
+@receiver(post_save, sender=Book)
+def reindex_saved_book(sender, instance, **kwargs):
+    _reindex_later([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    book_id = instance.pk
+    transaction.on_commit(lambda: search_index.remove_books([book_id]))
+    transaction.on_commit(candidate_table.invalidate)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Tag)
+def reindex_books_for_name(sender, instance, created, **kwargs):
+    if not created:
+        _reindex_later(instance.books.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Tag)
+def invalidate_on_name_delete(sender, instance, **kwargs):
+    _invalidate_later()
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.tags.through)
+def reindex_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _reindex_later([instance.pk])
+    elif pk_set:
+        _reindex_later(pk_set)
+    else:
+        # Reverse clear: the affected books are no longer known.
+        _invalidate_later()
+
+
+@receiver(pre_save, sender=Book)
+def remember_is_active(sender, instance, update_fields=None, raw=False, **kwargs):
+    if instance.pk and not raw and (update_fields is None or "is_active" in update_fields):
+        instance._active_before = Book.objects.filter(pk=instance.pk).values_list("is_active", flat=True).first()
+
+
+@receiver(post_save, sender=Book)
+def refresh_related_on_save(sender, instance, created, raw=False, **kwargs):
+    # New books have no links yet; m2m_changed below picks them up. Other
+    # edits (price, stock, description) leave every related list as it is.
+    before = getattr(instance, "_active_before", None)
+    instance._active_before = None
+    if not created and not raw and before is not None and before != instance.is_active:
+        schedule_refresh([instance.pk])
+
+
+@receiver(pre_delete, sender=Book)
+def refresh_related_on_delete(sender, instance, **kwargs):
+    schedule_refresh(RelatedBook.objects.filter(related=instance).values_list("book_id", flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Tag)
+def refresh_related_on_link_delete(sender, instance, **kwargs):
+    # The cascade removes the links without sending m2m_changed.
+    schedule_refresh(instance.books.values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.genres.through)
+@receiver(m2m_changed, sender=Book.tags.through)
+def refresh_related_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            schedule_refresh([instance.pk])
+    elif action in ("post_add", "post_remove") and pk_set:
+        schedule_refresh(pk_set)
+    elif action == "pre_clear":
+        schedule_refresh(instance.books.values_list("pk", flat=True))
+
+
+@receiver(pre_save, sender=Book)
+def remember_stock(sender, instance, update_fields=None, raw=False, **kwargs):
+    if instance.pk and not raw and (update_fields is None or "stock" in update_fields):
+        instance._stock_before = Book.objects.filter(pk=instance.pk).values_list("stock", flat=True).first()
+
+
+@receiver(post_save, sender=Book)
+def record_stock_edit(sender, instance, created, raw=False, **kwargs):
+    # Bulk paths (checkout, adjustments, imports) write their own movements.
+    if raw:
+        return
+    before = getattr(instance, "_stock_before", None)
+    instance._stock_before = None
+    if created:
+        delta, reason = instance.stock, "initial"
+    elif before is not None:
+        delta, reason = instance.stock - before, "edit"
+    else:
+        return
+    if delta:
+        StockMovement.objects.create(book=instance, delta=delta, reason=reason)
+
+
+@receiver(post_save, sender=Book)
+def build_cover_variants(sender, instance, raw=False, **kwargs):
+    if raw or not instance.cover or variants_current(instance):
+        return
+    from .tasks import generate_cover_variants
+
+    book_id = instance.pk
+    transaction.on_commit(lambda: generate_cover_variants.delay(book_id))
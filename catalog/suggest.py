@@ -0,0 +1,81 @@
+"""Process-wide fuzzy-match candidates for the autocomplete endpoint.
+
+Active books are flattened into parallel lists (slug, title, authors,
+search key) that ``rapidfuzz.process.extract`` scores directly; the
+returned index points straight back into the other lists. The table is
+rebuilt lazily whenever the shared version counter moves.
+"""
+import threading
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import Book
+
+try:
+    from rapidfuzz import utils as fuzz_utils  # type: ignore
+    default_process = fuzz_utils.default_process
+except Exception:  # pragma: no cover
+    def default_process(text):
+        return " ".join(text.lower().split())
+
+VERSION_KEY = "catalog:suggest:version"
+
+Candidates = namedtuple("Candidates", ["version", "slugs", "titles", "authors", "keys"])
+
+
+def _current_version():
+    cache.add(VERSION_KEY, 1, timeout=None)
+    return cache.get(VERSION_KEY) or 1
+
+
+class CandidateTable:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._candidates = None
+
+    def get(self):
+        version = _current_version()
+        candidates = self._candidates
+        if candidates is not None and candidates.version == version:
+            return candidates
+        with self._lock:
+            if self._candidates is None or self._candidates.version != version:
+                self._candidates = self._build(version)
+            return self._candidates
+
+    def invalidate(self):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 1, timeout=None)
+            cache.incr(VERSION_KEY)
+
+    def _build(self, version):
+        rows = list(Book.objects.filter(is_active=True).order_by("title").values_list("pk", "slug", "title"))
+        author_names = {}
+        for book_id, name in (
+            Book.authors.through.objects.filter(book__is_active=True)
+            .order_by("author__name")
+            .values_list("book_id", "author__name")
+        ):
+            author_names.setdefault(book_id, []).append(name)
+        tag_names = {}
+        for book_id, name in (
+            Book.tags.through.objects.filter(book__is_active=True)
+            .order_by("tag__name")
+            .values_list("book_id", "tag__name")
+        ):
+            tag_names.setdefault(book_id, []).append(name)
+
+        slugs, titles, authors, keys = [], [], [], []
+        for pk, slug, title in rows:
+            names = author_names.get(pk, [])
+            slugs.append(slug)
+            titles.append(title)
+            authors.append(", ".join(names))
+            keys.append(default_process(f"{title} {' '.join(names)} {' '.join(tag_names.get(pk, []))}"))
+        return Candidates(version, slugs, titles, authors, keys)
+
+
+candidate_table = CandidateTable()
@@ -0,0 +1,116 @@
+import logging
+from datetime import timedelta
+from io import TextIOWrapper
+
+from celery import shared_task
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from core.cache import bump_generation
+
+from .images import generate_variants, variants_current
+from .importer import BookImporter, ImportResult
+from .inventory import take_snapshot
+from .models import Book, ImportJob, ImportJobError
+from .related import refresh_books
+
+logger = logging.getLogger(__name__)
+
+# A "running" job whose progress has not moved for this long is presumed dead.
+STALE_AFTER = timedelta(minutes=10)
+# Pages rendered while a cover's derivatives are missing ask for them at most this often.
+COVER_REQUEST_TTL = 300
+
+
+def claim_job(job_id):
+    """Mark the job running unless another worker is actively running it."""
+    now = timezone.now()
+    claimable = Q(status__in=["pending", "failed"]) | Q(status="running", updated_at__lt=now - STALE_AFTER)
+    return ImportJob.objects.filter(claimable, pk=job_id).update(status="running", message="", updated_at=now)
+
+
+@shared_task
+def run_import_job(job_id):
+    if not claim_job(job_id):
+        return False
+    job = ImportJob.objects.get(pk=job_id)
+    if not job.started_at:
+        job.started_at = timezone.now()
+        job.save(update_fields=["started_at"])
+
+    result = ImportResult()
+    result.rows = job.rows_processed
+    result.created = job.created_count
+    result.updated = job.updated_count
+    result.full_refresh = job.last_row > 0
+    reported = [0]
+
+    def on_chunk(last_row, result):
+        new_errors = result.errors[reported[0]:]
+        reported[0] = len(result.errors)
+        ImportJobError.objects.bulk_create(
+            [ImportJobError(job=job, row_number=n, message=msg[:255]) for n, msg in new_errors]
+        )
+        job.last_row = last_row
+        job.rows_processed = result.rows
+        job.created_count = result.created
+        job.updated_count = result.updated
+        job.error_count += len(new_errors)
+        job.save(update_fields=[
+            "last_row", "rows_processed", "created_count", "updated_count", "error_count", "updated_at",
+        ])
+
+    try:
+        with job.file.open("rb") as raw:
+            BookImporter(reference=f"import:{job.pk}").run(
+                TextIOWrapper(raw, encoding="utf-8"), start_row=job.last_row, result=result, on_chunk=on_chunk
+            )
+    except Exception as exc:
+        logger.exception("Import job %s failed", job_id)
+        job.status = "failed"
+        job.message = f"Stopped after row {job.last_row}: {exc}"
+        job.save(update_fields=["status", "message", "updated_at"])
+        return False
+
+    job.status = "done"
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at", "updated_at"])
+    return True
+
+
+@shared_task
+def take_stock_snapshot():
+    snapshot = take_snapshot()
+    return snapshot.pk
+
+
+@shared_task
+def refresh_related_books(book_ids):
+    refresh_books(book_ids)
+    # Pages cached while the refresh ran must not outlive it.
+    bump_generation("book")
+
+
+@shared_task
+def generate_cover_variants(book_id):
+    book = Book.objects.filter(pk=book_id).only("pk", "title", "cover", "cover_variants").first()
+    if book is None or variants_current(book):
+        return False
+    try:
+        manifest = generate_variants(book)
+    except (OSError, ValueError, SyntaxError):
+        # Missing or undecodable file: the original keeps being served.
+        logger.exception("Could not build cover variants for book %s", book_id)
+        return False
+    # Only record them if the cover was not replaced meanwhile.
+    updated = Book.objects.filter(pk=book_id, cover=book.cover.name).update(cover_variants=manifest or {})
+    if updated:
+        bump_generation("book")
+    return bool(updated)
+
+
+def request_cover_variants(book_id):
+    """Queue derivative generation for a book, at most once per ``COVER_REQUEST_TTL``."""
+    if cache.add(f"cover-variants:{book_id}", 1, COVER_REQUEST_TTL):
+        generate_cover_variants.delay(book_id)
@@ -0,0 +1,56 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..images import variants_current
+
+register = template.Library()
+
+# Named layouts: the width served as ``src`` and the ``sizes`` hint.
+PRESETS = {
+    "thumb": (160, "110px"),
+    "card": (320, "(max-width: 600px) 50vw, 220px"),
+    "detail": (640, "(max-width: 900px) 100vw, 420px"),
+}
+
+
+def _srcset(storage, names):
+    return ", ".join(f"{storage.url(name)} {width}w" for width, name in sorted(names.items(), key=lambda i: int(i[0])))
+
+
+def _pick(storage, names, width):
+    # The preset width, or the largest one available below it.
+    widths = sorted(int(w) for w in names)
+    best = max((w for w in widths if w <= width), default=widths[0])
+    return storage.url(names[str(best)])
+
+
+@register.simple_tag
+def cover_image(book, preset="card", alt=None, **attrs):
+    """``<picture>`` for ``book.cover`` with AVIF/WebP ``srcset``s sized for ``preset``.
+
+    Until the derivatives exist the original is served and their generation
+    is queued. Extra keyword arguments become ``<img>`` attributes.
+    """
+    if not book.cover:
+        return ""
+    width, sizes = PRESETS[preset]
+    alt = book.title if alt is None else alt
+    attrs.setdefault("loading", "lazy")
+    extra = format_html_join("", ' {}="{}"', attrs.items())
+    if not variants_current(book):
+        from ..tasks import request_cover_variants
+
+        request_cover_variants(book.pk)
+        return format_html('<img src="{}" alt="{}"{}>', book.cover.url, alt, extra)
+
+    storage = book.cover.storage
+    variants = book.cover_variants
+    sources = format_html_join(
+        "",
+        '<source type="image/avif" srcset="{}" sizes="{}">',
+        [(_srcset(storage, variants["avif"]), sizes)] if variants.get("avif") else [],
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" decoding="async"{}></picture>',
+        sources, _pick(storage, variants["webp"], width), _srcset(storage, variants["webp"]), sizes, alt, extra,
+    )
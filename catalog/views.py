@@ -1,7 +1,15 @@
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
 from django.views.generic import ListView, DetailView, View
-from .models import Book, Author, Genre
+from core.cache import CachedPageMixin, ConditionalGetMixin
+from reviews.ratings import rating_histogram
+from reviews.views import book_reviews_page
+from . import facets
+from .models import Book
+from .pagination import cached_count, paginate_keyset
+from .search import search_index
+from .suggest import candidate_table, default_process
 try:
     from rapidfuzz import process, fuzz  # type: ignore
     HAS_FUZZ = True
@@ -11,55 +19,135 @@ except Exception:  # pragma: no cover
     HAS_FUZZ = False
 
 
-class CatalogListView(ListView):
+class CatalogListView(ConditionalGetMixin, CachedPageMixin, ListView):
     model = Book
     context_object_name = "books"
     paginate_by = 12
     template_name = "catalog/index.html"
+    cache_generations = ("book", "author", "genre", "tag")
 
-    def get_queryset(self):
-        qs = Book.objects.select_related("publisher").prefetch_related("authors", "genres", "tags").filter(is_active=True)
-        q = self.request.GET.get("q", "").strip()
-        genre = self.request.GET.get("genre")
-        author = self.request.GET.get("author")
-        price_min = self.request.GET.get("min")
-        price_max = self.request.GET.get("max")
-        availability = self.request.GET.get("avail")
+    def get_filters(self):
+        """Return the active filters as {facet: Q}, computed once per request."""
+        if hasattr(self, "_filters"):
+            return self._filters
+        params = self.request.GET
+        q = params.get("q", "").strip()
+        genre = params.get("genre")
+        author = params.get("author")
+        price_min = params.get("min")
+        price_max = params.get("max")
+        availability = params.get("avail")
+        filters = {}
+        self.search_ids = None
+        # The same filters as plain values, for ``facets.search_facets``.
+        self.filter_values = {"genre": genre, "author": author}
 
         if q:
-            qs = qs.filter(
-                Q(title__icontains=q)
-                | Q(isbn__icontains=q)
-                | Q(description__icontains=q)
-                | Q(authors__name__icontains=q)
-                | Q(tags__name__icontains=q)
-            ).distinct()
-
+            # Ranked by the in-memory index; filtered and counted in
+            # ``search_results`` rather than in SQL.
+            self.search_ids = search_index.search(q)
         if genre:
-            qs = qs.filter(genres__slug=genre)
+            filters["genre"] = Q(genres__slug=genre)
         if author:
-            qs = qs.filter(authors__slug=author)
+            filters["author"] = Q(authors__slug=author)
+        price = Q()
         if price_min:
             try:
-                qs = qs.filter(price__gte=float(price_min))
+                self.filter_values["price_min"] = float(price_min)
+                price &= Q(price__gte=self.filter_values["price_min"])
             except ValueError:
                 pass
         if price_max:
             try:
-                qs = qs.filter(price__lte=float(price_max))
+                self.filter_values["price_max"] = float(price_max)
+                price &= Q(price__lte=self.filter_values["price_max"])
             except ValueError:
                 pass
+        if price:
+            filters["price"] = price
         if availability == "in":
-            qs = qs.filter(stock__gt=0)
+            filters["avail"] = Q(stock__gt=0)
         elif availability == "out":
-            qs = qs.filter(stock__lte=0)
+            filters["avail"] = Q(stock__lte=0)
+        if availability in ("in", "out"):
+            self.filter_values["avail"] = availability
+
+        self._filters = filters
+        return filters
+
+    def filtered_books(self, exclude=()):
+        """Active books matching every filter except those named in ``exclude``."""
+        qs = Book.objects.filter(is_active=True)
+        for name, q in self.get_filters().items():
+            if name not in exclude:
+                qs = qs.filter(q)
+        return qs
+
+    def search_results(self):
+        """The search hits passing every filter, best first, with the facet counts.
+
+        Computed in one pass in Python, so the hit list never goes into a query.
+        """
+        if not hasattr(self, "_search_results"):
+            self._search_results = facets.search_facets(self.search_ids, **self.filter_values)
+        return self._search_results
+
+    def get_queryset(self):
+        self.get_filters()
+        if self.search_ids is not None:
+            # Paginated as ids; only the current page's books are fetched.
+            return self.search_results().matches
+        return (
+            self.filtered_books()
+            .select_related("publisher")
+            .prefetch_related("authors", "genres", "tags")
+            .order_by("title")
+        )
+
+    def cursor_mode(self):
+        # Opt-in keyset mode: any request carrying ?cursor= (even empty) pages
+        # by (title, id) instead of OFFSET. Not for searches: the keyset order
+        # would throw away the relevance ranking.
+        return "cursor" in self.request.GET and not self.request.GET.get("q", "").strip()
 
-        return qs.order_by("title")
+    def paginate_queryset(self, queryset, page_size):
+        if self.search_ids is not None:
+            paginator, page, ids, is_paginated = super().paginate_queryset(queryset, page_size)
+            books = Book.objects.select_related("publisher").prefetch_related("authors", "genres", "tags").in_bulk(ids)
+            page.object_list = [books[pk] for pk in ids if pk in books]
+            return paginator, page, page.object_list, is_paginated
+        if not self.cursor_mode():
+            return super().paginate_queryset(queryset, page_size)
+        # In keyset mode the total is cached per filter set.
+        page = paginate_keyset(queryset, page_size, self.request.GET.get("cursor"))
+        params = self.request.GET.copy()
+        params.pop("page", None)
+        params.pop("cursor", None)
+        page.count = cached_count(queryset, params.dict())
+        for attr, token in (("next_url", page.next_cursor), ("previous_url", page.previous_cursor)):
+            params["cursor"] = token or ""
+            setattr(page, attr, "?" + params.urlencode() if token else None)
+        return (None, page, page.object_list, page.has_other_pages())
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["genres"] = Genre.objects.all()
-        ctx["authors"] = Author.objects.all()
+        ctx["cursor_mode"] = self.cursor_mode()
+        filters = self.get_filters()
+        if self.search_ids is not None:
+            results = self.search_results()
+            ctx["genres"], ctx["authors"] = results.genres, results.authors
+            ctx["price_facets"], ctx["avail_facets"] = results.price, results.avail
+        else:
+            ctx["genres"] = facets.genre_facets(self.filtered_books(exclude=("genre",)).values("pk"))
+            ctx["authors"] = facets.author_facets(
+                self.filtered_books(exclude=("author",)).values("pk"),
+                selected=self.request.GET.get("author"),
+            )
+            ctx["price_facets"], ctx["avail_facets"] = facets.price_and_availability_facets(
+                self.filtered_books(exclude=("price", "avail")),
+                filters.get("price", Q()),
+                filters.get("avail", Q()),
+            )
         ctx["current"] = {
             "q": self.request.GET.get("q", ""),
             "genre": self.request.GET.get("genre", ""),
@@ -71,12 +159,13 @@ class CatalogListView(ListView):
         return ctx
 
 
-class BookDetailView(DetailView):
+class BookDetailView(ConditionalGetMixin, CachedPageMixin, DetailView):
     model = Book
     context_object_name = "book"
     template_name = "catalog/detail.html"
     slug_field = "slug"
     slug_url_kwarg = "slug"
+    cache_generations = ("book", "author", "publisher", "genre", "tag", "review")
 
     def get_queryset(self):
         return (
@@ -88,32 +177,30 @@ class BookDetailView(DetailView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         book = self.object
-        # Compute related books by weighted overlap: authors (3), genres (2), tags (1)
+        # Related books are precomputed (authors 3, genres 2, tags 1) in RelatedBook
         related_qs = (
-            Book.objects.filter(is_active=True)
-            .exclude(pk=book.pk)
-            .annotate(
-                author_overlap=Count("authors", filter=Q(authors__in=book.authors.all()), distinct=True),
-            )
-            .annotate(
-                genre_overlap=Count("genres", filter=Q(genres__in=book.genres.all()), distinct=True),
-            )
-            .annotate(
-                tag_overlap=Count("tags", filter=Q(tags__in=book.tags.all()), distinct=True),
-            )
-            .annotate(score=(3 * Count("authors", filter=Q(authors__in=book.authors.all()), distinct=True)
-                             + 2 * Count("genres", filter=Q(genres__in=book.genres.all()), distinct=True)
-                             + 1 * Count("tags", filter=Q(tags__in=book.tags.all()), distinct=True)))
-            .filter(Q(author_overlap__gt=0) | Q(genre_overlap__gt=0) | Q(tag_overlap__gt=0))
+            Book.objects.filter(related_from__book=book, is_active=True)
             .select_related("publisher")
-            .prefetch_related("authors", "genres", "tags")
-            .order_by("-score", "-rating", "title")[:8]
+            .prefetch_related("authors")
+            .order_by("related_from__rank")[:8]
         )
         ctx["related_books"] = related_qs
+        ctx["reviews_page"] = book_reviews_page(book, self.request.GET.get("reviews"))
+        ctx["rating_histogram"] = rating_histogram(book)
         return ctx
 
 
-class SuggestView(View):
+class SuggestView(ConditionalGetMixin, View):
+    cache_generations = ("book", "author", "tag")
+    varies_per_visitor = False
+    # Browsers may reuse an answer for the same prefix this long without asking.
+    max_age = 60
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        patch_cache_control(response, public=True, max_age=self.max_age)
+        return response
+
     def get(self, request):
         q = request.GET.get("q", "").strip()
         if not q:
@@ -144,26 +231,25 @@ class SuggestView(View):
                     "authors": ", ".join(a.name for a in b.authors.all()),
                     "score": 95,
                 })
-        # If still few and RapidFuzz available, fuzzy extend
+        # If still few and RapidFuzz available, fuzzy extend over the cached candidate table
         if len(results) < 5 and HAS_FUZZ:
-            candidates = []
-            for b in books:
-                key = f"{b.title} {' '.join(a.name for a in b.authors.all())} {' '.join(t.name for t in b.tags.all())}"
-                candidates.append((b.slug, key))
-            matches = process.extract(q, dict(candidates), scorer=fuzz.WRatio, limit=8)
-            for slug, score, _ in matches:
-                if slug in [r["slug"] for r in results] or score < 40:
-                    continue
-                try:
-                    b = next(b for b in books if b.slug == slug)
-                    results.append({
-                        "title": b.title,
-                        "slug": b.slug,
-                        "authors": ", ".join(a.name for a in b.authors.all()),
-                        "score": score,
-                    })
-                except StopIteration:
+            candidates = candidate_table.get()
+            seen = {r["slug"] for r in results}
+            matches = process.extract(
+                default_process(q), candidates.keys, scorer=fuzz.WRatio, processor=None,
+                limit=8, score_cutoff=40,
+            )
+            for _, score, idx in matches:
+                slug = candidates.slugs[idx]
+                if slug in seen:
                     continue
+                seen.add(slug)
+                results.append({
+                    "title": candidates.titles[idx],
+                    "slug": slug,
+                    "authors": candidates.authors[idx],
+                    "score": score,
+                })
         # Final fallback: recent books
         if not results:
             for b in Book.objects.filter(is_active=True).order_by("-created_at")[:5]:
@@ -0,0 +1,9 @@
+from celery import Celery
+
+# No DJANGO_SETTINGS_MODULE default here: importing ``config`` imports this
+# module, and a default set here would win over the one in wsgi.py, asgi.py
+# or manage.py. The worker and beat must be started with the variable set,
+# e.g. ``DJANGO_SETTINGS_MODULE=config.settings.prod celery -A config worker``.
+app = Celery("tbss")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
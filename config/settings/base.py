@@ -46,6 +46,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "allauth.account.middleware.AccountMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "orders.middleware.CartCookieMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -130,5 +131,50 @@ CACHES = {
     }
 }
 
+# Background tasks (order emails/SMS). Without a broker, tasks run eagerly
+# in-process, which is what tests and local development use.
+CELERY_BROKER_URL = env("CELERY_BROKER_URL", default=env("REDIS_URL", default="memory://"))
+CELERY_TASK_ALWAYS_EAGER = env.bool("CELERY_TASK_ALWAYS_EAGER", default=CELERY_BROKER_URL == "memory://")
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = TIME_ZONE
+# Run by `celery -A config beat`, started with DJANGO_SETTINGS_MODULE set.
+CELERY_BEAT_SCHEDULE = {
+    "stock-snapshot": {"task": "catalog.tasks.take_stock_snapshot", "schedule": 60 * 60 * 24},
+    "expire-carts": {"task": "orders.tasks.expire_carts", "schedule": 60 * 60 * 6},
+    "expire-momo-payments": {"task": "payments.tasks.expire_momo_payments", "schedule": 60},
+    "release-unpaid-momo-orders": {"task": "payments.tasks.release_unpaid_momo_orders", "schedule": 60 * 15},
+    "purge-idempotency-keys": {"task": "core.tasks.purge_idempotency_keys", "schedule": 60 * 60},
+}
+
+# How long a checkout or callback's idempotency key replays its response.
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=60 * 60 * 24)
+
+# Where carts live: "session", "db" (SavedCart table) or "cache" (Redis when
+# configured). The last two keep carts per user across devices.
+CART_BACKEND = env("CART_BACKEND", default="session")
+CART_TTL_DAYS = env.int("CART_TTL_DAYS", default=30)
+CART_COOKIE_NAME = "cart_token"
+
+# SMS gateway; with SMS_SANDBOX on, point SMS_API_URL at /dev/sms/ to use the
+# local stand-in instead of Hubtel (dev settings do). The stand-in needs no
+# HUBTEL_* credentials.
+SMS_API_URL = env("SMS_API_URL", default="https://sms.hubtel.com/v1/messages/send")
+SMS_SANDBOX = env.bool("SMS_SANDBOX", default=DEBUG)
+
+# Mobile Money collections. Callbacks are signed with MOMO_WEBHOOK_SECRET
+# (HMAC-SHA256 of the body). With MOMO_SANDBOX on, point MOMO_API_URL at
+# /payments/dev/momo/ to use the local fake provider.
+MOMO_API_URL = env("MOMO_API_URL", default="")
+# Public address of this site, for the callback URL given to the provider.
+SITE_URL = env("SITE_URL", default="http://localhost:8000")
+MOMO_API_KEY = env("MOMO_API_KEY", default="")
+MOMO_WEBHOOK_SECRET = env("MOMO_WEBHOOK_SECRET", default="")
+MOMO_PROMPT_TTL = env.int("MOMO_PROMPT_TTL", default=300)  # seconds to approve a prompt
+# Seconds a failed or expired payment may wait for a retry before its order
+# is cancelled and its stock released.
+MOMO_RELEASE_AFTER = env.int("MOMO_RELEASE_AFTER", default=60 * 60 * 24)
+MOMO_SANDBOX = env.bool("MOMO_SANDBOX", default=DEBUG)
+
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 CSRF_TRUSTED_ORIGINS = env.list("CSRF_TRUSTED_ORIGINS", default=[])
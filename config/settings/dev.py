@@ -4,5 +4,11 @@ DEBUG = False
 ALLOWED_HOSTS = ["*"]
 EMAIL_BACKEND = "anymail.backends.console.EmailBackend"
 
+SMS_SANDBOX = True
+# The local stand-in (core.views.sms_sandbox), unless a real gateway is given.
+SMS_API_URL = env("SMS_API_URL", default=SITE_URL.rstrip("/") + "/dev/sms/")
+MOMO_SANDBOX = True
+MOMO_WEBHOOK_SECRET = MOMO_WEBHOOK_SECRET or "sandbox"
+
 # Simple cache for dev
 CACHES["default"]["BACKEND"] = "django.core.cache.backends.locmem.LocMemCache"
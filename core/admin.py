@@ -0,0 +1,28 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import FailedNotification
+from .tasks import send_order_email_task, send_sms_task, send_status_update_task
+
+
+@admin.register(FailedNotification)
+class FailedNotificationAdmin(admin.ModelAdmin):
+    list_display = ("channel", "recipient", "attempts", "created_at", "requeued_at")
+    list_filter = ("channel", "created_at")
+    search_fields = ("recipient", "error")
+    readonly_fields = ("channel", "recipient", "payload", "error", "attempts", "created_at", "requeued_at")
+    actions = ["requeue"]
+
+    def requeue(self, request, queryset):
+        count = 0
+        for failed in queryset.filter(requeued_at__isnull=True):
+            if "order_ids" in failed.payload:
+                send_status_update_task.delay(failed.payload["order_ids"], failed.payload["status"], sms=False)
+            elif failed.channel == "email":
+                send_order_email_task.delay(failed.payload["order_id"], failed.payload.get("subject_prefix", "Order"))
+            else:
+                send_sms_task.delay(failed.recipient, failed.payload["message"])
+            count += 1
+        queryset.filter(requeued_at__isnull=True).update(requeued_at=timezone.now())
+        self.message_user(request, f"Requeued {count} notifications.")
+    requeue.short_description = "Requeue selected notifications"
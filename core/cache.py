@@ -0,0 +1,170 @@
+"""Generation-keyed page and fragment caching.
+
+Every cached entry embeds the current "generation" of the models it was
+built from. Signal handlers in ``core.signals`` bump a model's generation
+whenever one of its rows changes, so new requests compute new keys and old
+entries simply age out; nothing is ever served stale. Generations live in
+the default cache, so they are shared across gunicorn workers when Redis
+is configured.
+"""
+import hashlib
+import re
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from orders.cart import get_cart
+
+GENERATION_PREFIX = "gen:"
+# Backends whose entries no other process can see.
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+PAGE_CACHE_TIMEOUT = 60 * 10
+
+CSRF_INPUT_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = rb"\1__csrf_token__\2"
+
+
+def _seed():
+    # Seeding from the clock means an evicted counter never restarts at a value
+    # an older cached page was keyed on.
+    return int(time.time() * 1000)
+
+
+def get_generations(*names):
+    """Return a key fragment such as ``book.17-author.3`` for the given models."""
+    keys = [GENERATION_PREFIX + name for name in names]
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    for key in missing:
+        cache.add(key, _seed(), timeout=None)
+    if missing:
+        values.update(cache.get_many(missing))
+    return "-".join(f"{name}.{values.get(GENERATION_PREFIX + name, 0)}" for name in names)
+
+
+def generations_shared():
+    """True when generations live in a cache every worker sees (Redis)."""
+    return settings.CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
+
+
+def bump_generation(*names):
+    for name in names:
+        key = GENERATION_PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=None)
+
+
+def is_shared_request(request):
+    """True for GETs whose page is the same for every such visitor.
+
+    Anonymous visitors with an empty cart and no pending messages all see the
+    same page chrome.
+    """
+    return (
+        request.method in ("GET", "HEAD")
+        and not request.user.is_authenticated
+        and not get_cart(request)
+        and not len(get_messages(request))
+    )
+
+
+class GenerationMixin:
+    """Expose the generations of ``cache_generations`` to the view and templates."""
+
+    cache_generations = ()
+
+    def get_cache_generation(self):
+        if not hasattr(self, "_cache_generation"):
+            self._cache_generation = get_generations(*self.cache_generations)
+        return self._cache_generation
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["cache_generation"] = self.get_cache_generation()
+        return ctx
+
+
+class CachedPageMixin(GenerationMixin):
+    """Serve rendered pages for anonymous visitors from the cache.
+
+    Only requests passing ``is_shared_request`` are cached. The CSRF token in
+    the footer form is swapped for the visitor's own on every hit.
+    ``cache_generation`` is also exposed to templates for ``{% cache %}``
+    fragments that authenticated visitors still benefit from.
+    """
+
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    def is_page_cacheable(self, request):
+        return is_shared_request(request)
+
+    def get_page_cache_key(self, request):
+        path = hashlib.md5(request.get_full_path().encode("utf-8")).hexdigest()
+        return f"page:{self.__class__.__name__}:{self.get_cache_generation()}:{path}"
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            token = get_token(request).encode("ascii")
+            return HttpResponse(content.replace(b"__csrf_token__", token), content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            if hasattr(response, "render"):
+                response.render()
+            content = CSRF_INPUT_RE.sub(CSRF_PLACEHOLDER, response.content)
+            cache.set(key, (content, response["Content-Type"]), self.page_cache_timeout)
+        return response
+
+
+class ConditionalGetMixin(GenerationMixin):
+    """Answer repeat GETs with 304 Not Modified before anything is rendered.
+
+    The ETag combines the URL, the view's generations and
+    ``get_last_modified()``; for views with ``varies_per_visitor`` it also
+    covers the visitor's user and cart, and Last-Modified is then only sent
+    for shared pages, where nothing else varies.
+
+    A client that only sends If-Modified-Since is judged on Last-Modified
+    alone, so ``get_last_modified`` must cover every input to the page:
+    renames of linked rows, deletions, added or removed links. Views that
+    cannot say that cheaply leave it out and rely on the ETag.
+    """
+
+    varies_per_visitor = True
+
+    def get_last_modified(self):
+        return None
+
+    def get_etag_parts(self, request):
+        parts = [request.get_full_path(), self.get_cache_generation()]
+        if self.varies_per_visitor:
+            parts += [request.user.pk if request.user.is_authenticated else "anon", get_cart(request).signature()]
+        return parts
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or len(get_messages(request)):
+            return super().dispatch(request, *args, **kwargs)
+        last_modified = self.get_last_modified()
+        parts = self.get_etag_parts(request) + [last_modified.timestamp() if last_modified else None]
+        etag = hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+        if self.varies_per_visitor and not is_shared_request(request):
+            last_modified = None
+        return condition(
+            etag_func=lambda *a, **kw: etag,
+            last_modified_func=lambda *a, **kw: last_modified,
+        )(super().dispatch)(request, *args, **kwargs)
@@ -0,0 +1,150 @@
+"""Idempotency keys for unsafe requests.
+
+A view wrapped with ``idempotent`` runs at most once per client key. The
+key is claimed by inserting an ``IdempotencyKey`` row, whose unique digest
+means only one request can win. When the view finishes, its response is
+stored on the row and duplicates get the stored response, with no DB
+writes or notifications run again. A duplicate that arrives while the
+first request is still running waits up to ``wait`` seconds for it to
+finish, then gets a 409.
+
+Only 2xx responses, and responses passed through ``keep``, are stored. For
+anything else (a failed validation, an exception) the key is released, so
+the client can retry with the same key. Rows live for
+``IDEMPOTENCY_KEY_TTL`` seconds; ``purge_expired`` deletes them in batches.
+"""
+import functools
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+# A claim still "started" after this long belongs to a request that died.
+STALE_AFTER = timedelta(minutes=2)
+POLL_INTERVAL = 0.2
+
+
+def keep(response):
+    """Store ``response`` for replay even though it is not a 2xx."""
+    response.idempotent = True
+    return response
+
+
+def _digest(scope, key):
+    return hashlib.sha256(f"{scope}:{key}".encode("utf-8")).hexdigest()
+
+
+def claim(scope, key):
+    """Return ``(won, row)``, where ``won`` means this request should run the view.
+
+    Expired rows and abandoned claims are taken over.
+    """
+    digest = _digest(scope, key)
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    try:
+        with transaction.atomic():
+            return True, IdempotencyKey.objects.create(digest=digest, scope=scope, expires_at=expires_at)
+    except IntegrityError:
+        pass
+    taken_over = IdempotencyKey.objects.filter(
+        Q(expires_at__lt=now) | Q(state="started", created_at__lt=now - STALE_AFTER), digest=digest
+    ).update(state="started", created_at=now, expires_at=expires_at, status_code=None, location="", body="")
+    row = IdempotencyKey.objects.filter(digest=digest).first()
+    if row is None:
+        # Released since our insert failed; the key is free again.
+        return claim(scope, key)
+    return bool(taken_over), row
+
+
+def store(row, response):
+    IdempotencyKey.objects.filter(pk=row.pk).update(
+        state="done",
+        status_code=response.status_code,
+        content_type=response.get("Content-Type", ""),
+        location=response.get("Location", ""),
+        body="" if response.streaming else response.content.decode(response.charset, "replace"),
+    )
+
+
+def release(row):
+    IdempotencyKey.objects.filter(pk=row.pk, state="started").delete()
+
+
+def replay(row):
+    response = HttpResponse(row.body, status=row.status_code, content_type=row.content_type or None)
+    if row.location:
+        response["Location"] = row.location
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def wait_for(row, timeout):
+    """Poll a claim until it is done or ``timeout`` runs out.
+
+    Returns the latest row, or None if the claim was released meanwhile.
+    """
+    deadline = time.monotonic() + timeout
+    while row.state != "done" and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        row = IdempotencyKey.objects.filter(pk=row.pk).first()
+        if row is None:
+            return None
+    return row
+
+
+def idempotent(scope, get_key, wait=0):
+    """Decorate a view so each key returned by ``get_key(request)`` runs it once.
+
+    Requests without a key run as usual.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = get_key(request)
+            if not key:
+                return view(request, *args, **kwargs)
+            won, row = claim(scope, key)
+            if not won:
+                row = wait_for(row, wait)
+                if row is None:
+                    # The first request gave its key back; this one may try.
+                    won, row = claim(scope, key)
+                elif row.state == "done":
+                    return replay(row)
+            if not won:
+                return JsonResponse({"error": "a request with this key is in progress"}, status=409)
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                release(row)
+                raise
+            if 200 <= response.status_code < 300 or getattr(response, "idempotent", False):
+                store(row, response)
+            else:
+                release(row)
+            return response
+        return wrapper
+    return decorator
+
+
+def header_key(request):
+    return request.headers.get("Idempotency-Key", "")
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys a batch at a time; returns how many went."""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lt=now).values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids, expires_at__lt=now).delete()[0]
@@ -0,0 +1,46 @@
+from django.db import models
+from django.utils import timezone
+
+
+class FailedNotification(models.Model):
+    """Dead-letter record for an email or SMS that exhausted its retries."""
+    CHANNEL_CHOICES = (
+        ("email", "Email"),
+        ("sms", "SMS"),
+    )
+
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=254)
+    payload = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    requeued_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} to {self.recipient}"
+
+
+class IdempotencyKey(models.Model):
+    """A request key seen by ``core.idempotency`` and, once done, the response it got."""
+    STATE_CHOICES = (
+        ("started", "Started"),
+        ("done", "Done"),
+    )
+
+    # sha256 of scope and client key, so any key length fits.
+    digest = models.CharField(max_length=64, unique=True)
+    scope = models.CharField(max_length=50)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default="started")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=500, blank=True)
+    body = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.scope} {self.digest[:12]} ({self.state})"
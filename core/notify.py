@@ -1,47 +1,133 @@
+"""Customer notifications.
+
+``send_order_email`` and ``send_sms`` queue the work on the task queue once
+the current transaction commits, so requests never wait on SMTP or the SMS
+gateway. The ``deliver_*`` functions do the actual sending and raise on
+failure so the tasks in ``core.tasks`` can retry; ``deliver_status_emails``
+instead reports which messages failed, so only those are retried.
+"""
 import os
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.conf import settings
 from urllib import request as urlrequest
-from urllib import parse as urlparse
 import json
 
 
-def send_order_email(order, subject_prefix="Order"):
+def deliver_order_email(order, subject_prefix="Order"):
     subject = f"{subject_prefix} #{order.order_number} - TBSS"
     from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@tbss.com")
     to = [order.email]
     body = render_to_string("emails/order_confirmation.txt", {"order": order})
+    send_mail(subject, body, from_email, to, fail_silently=False)
+
+
+STATUS_SUBJECTS = {
+    "paid": "Order Paid",
+    "shipped": "Order Shipped",
+    "delivered": "Order Delivered",
+}
+STATUS_SMS = {
+    "paid": "TBSS: Payment received for order {number}. Thank you!",
+    "shipped": "TBSS: Your order {number} is on its way.",
+    "delivered": "TBSS: Your order {number} has been delivered. Thank you for shopping with us!",
+}
+
+
+def deliver_status_emails(orders, status):
+    """Email each order's customer about its new status over a single connection.
+
+    Returns ``[(order, exception)]`` for the messages that were not sent, so
+    only those are tried again.
+    """
+    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@tbss.com")
+    sent, failed = set(), []
     try:
-        send_mail(subject, body, from_email, to, fail_silently=True)
-    except Exception:
-        # Ignore email errors in dev
-        pass
+        with get_connection(fail_silently=False) as connection:
+            for order in orders:
+                message = EmailMessage(
+                    f"{STATUS_SUBJECTS[status]} #{order.order_number} - TBSS",
+                    render_to_string("emails/order_status.txt", {"order": order, "status": status}),
+                    from_email,
+                    [order.email],
+                )
+                try:
+                    connection.send_messages([message])
+                except Exception as exc:
+                    failed.append((order, exc))
+                else:
+                    sent.add(order.pk)
+    except Exception as exc:
+        # No connection, or it broke: every message not yet tried failed too.
+        tried = sent | {order.pk for order, _ in failed}
+        failed += [(order, exc) for order in orders if order.pk not in tried]
+    return failed
 
 
-def send_sms(phone: str, message: str):
+def deliver_sms(phone: str, message: str):
+    """POST one SMS to the gateway. Returns False when SMS is not configured.
+
+    With ``SMS_SANDBOX`` on no credentials are needed: the local stand-in
+    takes anything.
+    """
     api_key = os.environ.get("HUBTEL_API_KEY")
     client_id = os.environ.get("HUBTEL_CLIENT_ID")
     sender = os.environ.get("HUBTEL_SENDER", "TBSS")
-    if not (api_key and client_id):
+    headers = {"Content-Type": "application/json"}
+    if api_key and client_id:
+        headers["Authorization"] = f"Basic {api_key}:{client_id}"
+    elif not settings.SMS_SANDBOX:
         return False
+    payload = {
+        "from": sender,
+        "to": phone,
+        "content": message,
+    }
+    data = json.dumps(payload).encode("utf-8")
+    req = urlrequest.Request(
+        url=settings.SMS_API_URL,
+        data=data,
+        headers=headers,
+        method="POST",
+    )
+    urlrequest.urlopen(req, timeout=5)
+    return True
+
+
+def _enqueue(task, args, channel, recipient, payload):
+    from .models import FailedNotification
+
     try:
-        payload = {
-            "from": sender,
-            "to": phone,
-            "content": message,
-        }
-        data = json.dumps(payload).encode("utf-8")
-        req = urlrequest.Request(
-            url="https://sms.hubtel.com/v1/messages/send",
-            data=data,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Basic {api_key}:{client_id}",
-            },
-            method="POST",
+        task.delay(*args)
+    except Exception as exc:
+        # Broker unreachable: park it in the dead-letter table for a requeue
+        # rather than failing a request that already committed.
+        FailedNotification.objects.create(
+            channel=channel, recipient=recipient, payload=payload, error=f"enqueue failed: {exc!r}"
         )
-        urlrequest.urlopen(req, timeout=5)
-        return True
-    except Exception:
-        return False
+
+
+def send_order_email(order, subject_prefix="Order"):
+    from .tasks import send_order_email_task
+
+    args = (order.pk, subject_prefix)
+    payload = {"order_id": order.pk, "subject_prefix": subject_prefix}
+    transaction.on_commit(lambda: _enqueue(send_order_email_task, args, "email", order.email, payload))
+
+
+def send_sms(phone: str, message: str):
+    from .tasks import send_sms_task
+
+    transaction.on_commit(lambda: _enqueue(send_sms_task, (phone, message), "sms", phone, {"message": message}))
+
+
+def send_status_update(order_ids, status):
+    """Queue the status emails and SMSes for a batch of orders as one task."""
+    from .tasks import send_status_update_task
+
+    order_ids = list(order_ids)
+    payload = {"order_ids": order_ids, "status": status}
+    transaction.on_commit(
+        lambda: _enqueue(send_status_update_task, (order_ids, status), "email", f"{len(order_ids)} orders", payload)
+    )
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from blog.models import Post
+from catalog.models import Author, Book, Genre, Publisher, Tag
+from reviews.models import Review
+
+from .cache import bump_generation
+
+GENERATION_NAMES = {
+    Book: "book",
+    Author: "author",
+    Publisher: "publisher",
+    Genre: "genre",
+    Tag: "tag",
+    Post: "post",
+    Review: "review",
+}
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Publisher)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Review)
+def bump_model_generation(sender, **kwargs):
+    name = GENERATION_NAMES[sender]
+    transaction.on_commit(lambda: bump_generation(name))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.genres.through)
+@receiver(m2m_changed, sender=Book.tags.through)
+def bump_book_generation_on_links(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(lambda: bump_generation("book"))
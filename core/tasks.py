@@ -0,0 +1,100 @@
+from celery import shared_task
+
+from .models import FailedNotification
+from . import notify
+
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 30  # seconds; doubles on every attempt
+
+
+def can_retry(task):
+    """True if ``task`` may retry later.
+
+    Never when it runs eagerly (no broker): the retries would run inline in
+    the request that queued it, back to back.
+    """
+    return not task.request.is_eager and task.request.retries < task.max_retries
+
+
+def _retry_or_dead_letter(task, exc, channel, recipient, payload):
+    if not can_retry(task):
+        FailedNotification.objects.create(
+            channel=channel,
+            recipient=recipient,
+            payload=payload,
+            error=repr(exc),
+            attempts=task.request.retries + 1,
+        )
+        return False
+    raise task.retry(exc=exc, countdown=RETRY_BASE_DELAY * 2 ** task.request.retries)
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES)
+def send_order_email_task(self, order_id, subject_prefix="Order"):
+    from orders.models import Order
+
+    order = Order.objects.select_related("shipping_method").filter(pk=order_id).first()
+    if order is None:
+        return False
+    try:
+        notify.deliver_order_email(order, subject_prefix)
+    except Exception as exc:
+        return _retry_or_dead_letter(
+            self, exc, "email", order.email, {"order_id": order_id, "subject_prefix": subject_prefix}
+        )
+    return True
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES)
+def send_sms_task(self, phone, message):
+    try:
+        return notify.deliver_sms(phone, message)
+    except Exception as exc:
+        return _retry_or_dead_letter(self, exc, "sms", phone, {"message": message})
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES)
+def send_status_update_task(self, order_ids, status, sms=True):
+    """Emails first, retrying only the ones that failed; then SMSes, dead-lettered one by one.
+
+    The SMSes go out on the first run only, so a retry never repeats them.
+    """
+    from orders.models import Order
+
+    orders = list(Order.objects.select_related("shipping_method").filter(pk__in=order_ids).order_by("pk"))
+    failed_emails = notify.deliver_status_emails(orders, status)
+    if sms:
+        failed = []
+        for order in orders:
+            message = notify.STATUS_SMS[status].format(number=order.order_number)
+            try:
+                notify.deliver_sms(order.phone, message)
+            except Exception as exc:
+                failed.append(FailedNotification(
+                    channel="sms", recipient=order.phone, payload={"message": message}, error=repr(exc), attempts=1
+                ))
+        FailedNotification.objects.bulk_create(failed)
+    if not failed_emails:
+        return True
+    if can_retry(self):
+        raise self.retry(
+            args=([order.pk for order, _ in failed_emails], status),
+            kwargs={"sms": False},
+            exc=failed_emails[0][1],
+            countdown=RETRY_BASE_DELAY * 2 ** self.request.retries,
+        )
+    FailedNotification.objects.bulk_create([
+        FailedNotification(
+            channel="email", recipient=order.email, error=repr(exc), attempts=self.request.retries + 1,
+            payload={"order_ids": [order.pk], "status": status},
+        )
+        for order, exc in failed_emails
+    ])
+    return False
+
+
+@shared_task
+def purge_idempotency_keys():
+    from .idempotency import purge_expired
+
+    return purge_expired()
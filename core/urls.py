@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.urls import path
-from .views import HomeView, AboutView
+from .views import HomeView, AboutView, sms_sandbox
 
 urlpatterns = [
     path("", HomeView.as_view(), name="home"),
     path("about/", AboutView.as_view(), name="about"),
 ]
+
+if settings.SMS_SANDBOX:
+    urlpatterns += [path("dev/sms/", sms_sandbox, name="sms_sandbox")]
@@ -1,9 +1,20 @@
+import json
+import logging
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 from catalog.models import Book
+from .cache import CachedPageMixin
+
+sms_log = logging.getLogger("tbss.sms")
 
 
-class HomeView(TemplateView):
+class HomeView(CachedPageMixin, TemplateView):
     template_name = "core/home.html"
+    cache_generations = ("book", "author")
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx["featured_books"] = (
@@ -17,3 +28,15 @@ class HomeView(TemplateView):
 
 class AboutView(TemplateView):
     template_name = "core/about.html"
+
+
+@csrf_exempt
+@require_POST
+def sms_sandbox(request):
+    """Local stand-in for the SMS gateway (SMS_SANDBOX only): logs and accepts."""
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "invalid JSON"}, status=400)
+    sms_log.info("SMS to %s: %s", payload.get("to"), payload.get("content"))
+    return JsonResponse({"status": "accepted"}, status=201)
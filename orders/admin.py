@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.shortcuts import render
+from django.urls import path
+
+from .fulfillment import packing_list, transition
 from .models import ShippingMethod, Order, OrderItem
 
 
@@ -22,3 +26,46 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ("order_number", "email", "full_name")
     readonly_fields = ("order_number", "subtotal", "shipping_fee", "total", "created_at", "updated_at")
     inlines = [OrderItemInline]
+    # Served by the (status, created_at) and created_at indexes.
+    ordering = ("-created_at",)
+    # Skip the unfiltered COUNT(*) over every order on each page.
+    show_full_result_count = False
+    actions = ["mark_shipped", "mark_delivered", "print_packing_list"]
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom = [
+            path("packing-list/", self.admin_site.admin_view(self.packing_list_view), name="orders_order_packing_list"),
+        ]
+        return custom + urls
+
+    def packing_list_view(self, request, queryset=None):
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Packing list",
+            "rows": packing_list(queryset),
+            "selected": queryset is not None,
+        }
+        return render(request, "admin/orders/order_packing_list.html", context)
+
+    def _transition(self, request, queryset, status):
+        selected = queryset.count()
+        moved = transition(queryset, status)
+        skipped = selected - moved
+        message = f"Marked {moved} orders as {status}; customers will be notified."
+        if skipped:
+            message += f" {skipped} were not eligible and were left unchanged."
+        self.message_user(request, message)
+
+    def mark_shipped(self, request, queryset):
+        self._transition(request, queryset, "shipped")
+
+    def mark_delivered(self, request, queryset):
+        self._transition(request, queryset, "delivered")
+
+    def print_packing_list(self, request, queryset):
+        return self.packing_list_view(request, queryset)
+
+    mark_shipped.short_description = "Mark selected orders as shipped"
+    mark_delivered.short_description = "Mark selected orders as delivered"
+    print_packing_list.short_description = "Packing list for selected orders"
@@ -0,0 +1,365 @@
+"""The shopping cart.
+
+A cart is lines of ``{book_id: [qty, price, slug]}``. The price is the one
+seen when the line last changed. Where the lines live depends on
+``settings.CART_BACKEND``:
+
+* ``"session"`` (default): in the session, as
+  ``{"lines": ..., "count": n}``.
+* ``"db"``: ``SavedCart``/``SavedCartLine`` rows, one upsert or delete per
+  changed line.
+* ``"cache"``: a Redis hash per cart with a TTL, or a plain cache entry
+  when the cache is not Redis.
+
+The two server-side backends key carts by ``user:<pk>`` or, for anonymous
+visitors, by a random token in a signed cookie. This keeps carts out of
+the session, lets them follow a user across devices and lets them be
+merged on login (see ``orders.signals``). Views share one ``Cart`` per
+request through ``get_cart``. Its lines are loaded at most once and its
+books fetched at most once.
+"""
+import json
+import secrets
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from catalog.models import Book
+
+CART_SESSION_KEY = "cart"
+CART_COOKIE_SALT = "orders.cart"
+
+
+def cart_ttl():
+    return timedelta(days=settings.CART_TTL_DAYS)
+
+
+class SessionCartStore:
+    def __init__(self, session):
+        self.session = session
+
+    def load(self):
+        data = self.session.get(CART_SESSION_KEY) or {}
+        if "lines" in data:
+            self.data = data
+        else:
+            self.data = self._from_legacy(data)
+            if data:
+                self._save()
+        return self.data["lines"]
+
+    @staticmethod
+    def _from_legacy(old):
+        # Sessions from before the cart kept book ids were {slug: qty}.
+        data = {"lines": {}, "count": 0}
+        if old:
+            for book in Book.objects.filter(slug__in=old.keys()).only("pk", "slug", "price"):
+                data["lines"][str(book.pk)] = [int(old[book.slug]), str(book.price), book.slug]
+        return data
+
+    def _save(self):
+        self.data["count"] = sum(line[0] for line in self.data["lines"].values())
+        self.session[CART_SESSION_KEY] = self.data
+        self.session.modified = True
+
+    # ``lines`` returned by load() is the dict being edited; just persist it.
+    def save_line(self, key, line):
+        self._save()
+
+    def delete_line(self, key):
+        self._save()
+
+    def clear(self):
+        self.data = {"lines": {}, "count": 0}
+        self._save()
+
+
+class DatabaseCartStore:
+    def __init__(self, owner, exists=True):
+        self.owner = owner
+        # False for a token minted this request: there is nothing to load.
+        self.exists = exists
+        self.cart_id = None
+
+    def load(self):
+        from .models import SavedCartLine
+
+        if not self.exists:
+            return {}
+        lines = {}
+        rows = SavedCartLine.objects.filter(cart__owner=self.owner).values_list(
+            "cart_id", "book_id", "quantity", "price", "book__slug"
+        )
+        for cart_id, book_id, qty, price, slug in rows:
+            self.cart_id = cart_id
+            lines[str(book_id)] = [qty, str(price), slug]
+        return lines
+
+    def _touch(self):
+        """Return the cart row's id, creating the row, and mark it as just used."""
+        from .models import SavedCart
+
+        carts = SavedCart.objects.filter(owner=self.owner)
+        if self.cart_id is None:
+            self.cart_id = carts.values_list("pk", flat=True).first()
+        if self.cart_id is None:
+            try:
+                with transaction.atomic():
+                    self.cart_id = SavedCart.objects.create(owner=self.owner).pk
+            except IntegrityError:
+                self.cart_id = carts.values_list("pk", flat=True).get()
+        else:
+            SavedCart.objects.filter(pk=self.cart_id).update(updated_at=timezone.now())
+        return self.cart_id
+
+    def save_line(self, key, line):
+        from .models import SavedCartLine
+
+        qty, price, _ = line
+        SavedCartLine.objects.bulk_create(
+            [SavedCartLine(cart_id=self._touch(), book_id=int(key), quantity=qty, price=Decimal(price))],
+            update_conflicts=True,
+            unique_fields=["cart", "book"],
+            update_fields=["quantity", "price"],
+        )
+
+    def delete_line(self, key):
+        from .models import SavedCartLine
+
+        SavedCartLine.objects.filter(cart_id=self._touch(), book_id=int(key)).delete()
+
+    def clear(self):
+        from .models import SavedCart
+
+        SavedCart.objects.filter(owner=self.owner).delete()
+        self.cart_id = None
+
+
+def _redis():
+    try:
+        from django_redis import get_redis_connection  # type: ignore
+        return get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        return None
+
+
+class CacheCartStore:
+    def __init__(self, owner, exists=True):
+        self.key = f"cart:{owner}"
+        self.exists = exists
+        self.redis = _redis()
+        self.ttl = int(cart_ttl().total_seconds())
+
+    def load(self):
+        if not self.exists:
+            return {}
+        if self.redis is None:
+            return cache.get(self.key) or {}
+        raw = self.redis.hgetall(cache.make_key(self.key))
+        return {field.decode(): json.loads(value) for field, value in raw.items()}
+
+    def save_line(self, key, line):
+        if self.redis is None:
+            lines = cache.get(self.key) or {}
+            lines[key] = line
+            cache.set(self.key, lines, self.ttl)
+            return
+        name = cache.make_key(self.key)
+        self.redis.pipeline().hset(name, key, json.dumps(line)).expire(name, self.ttl).execute()
+
+    def delete_line(self, key):
+        if self.redis is None:
+            lines = cache.get(self.key) or {}
+            lines.pop(key, None)
+            cache.set(self.key, lines, self.ttl)
+            return
+        name = cache.make_key(self.key)
+        self.redis.pipeline().hdel(name, key).expire(name, self.ttl).execute()
+
+    def clear(self):
+        if self.redis is None:
+            cache.delete(self.key)
+        else:
+            self.redis.delete(cache.make_key(self.key))
+
+
+STORES = {"db": DatabaseCartStore, "cache": CacheCartStore}
+
+
+def store_for(owner, exists=True):
+    """The server-side store for ``owner`` under the configured backend."""
+    return STORES[settings.CART_BACKEND](owner, exists=exists)
+
+
+class Cart:
+    def __init__(self, store):
+        self.store = store
+        self._lines = None
+        self._books = None
+        # Set by get_cart when an anonymous token was minted for this request.
+        self.new_token = None
+        self.written = False
+
+    @property
+    def data(self):
+        if self._lines is None:
+            self._lines = self.store.load()
+        return self._lines
+
+    def _save_line(self, key):
+        line = self.data.get(key)
+        if line is None:
+            self.store.delete_line(key)
+        else:
+            self.store.save_line(key, line)
+        self.written = True
+
+    @property
+    def count(self):
+        return sum(line[0] for line in self.data.values())
+
+    def __len__(self):
+        return len(self.data)
+
+    def __bool__(self):
+        return bool(self.data)
+
+    def quantity(self, book_id):
+        line = self.data.get(str(book_id))
+        return line[0] if line else 0
+
+    def book_id_for(self, slug):
+        """The id of the cart line for ``slug``, without a query, or None."""
+        for book_id, line in self.data.items():
+            if line[2] == slug:
+                return int(book_id)
+        return None
+
+    def signature(self):
+        """Hashable summary of the contents, for ETags."""
+        return sorted((int(pk), line[0]) for pk, line in self.data.items())
+
+    def set_quantity(self, book, qty):
+        """Set ``book``'s line to ``qty`` (removing it at 0) with a fresh price snapshot."""
+        key = str(book.pk)
+        if qty <= 0:
+            self.data.pop(key, None)
+        else:
+            self.data[key] = [qty, str(book.price), book.slug]
+            if self._books is not None:
+                self._books[book.pk] = book
+        self._save_line(key)
+
+    def decrease(self, book_id):
+        """Lower a line by one and return the new quantity."""
+        key = str(book_id)
+        line = self.data.get(key)
+        if not line:
+            return 0
+        line[0] -= 1
+        if line[0] <= 0:
+            del self.data[key]
+        self._save_line(key)
+        return max(line[0], 0)
+
+    def remove(self, book_id):
+        key = str(book_id)
+        if self.data.pop(key, None) is not None:
+            self._save_line(key)
+            return True
+        return False
+
+    def clear(self):
+        if self.data:
+            self.store.clear()
+            self._lines = {}
+            self.written = True
+
+    def books(self):
+        """{book_id: Book} for the lines, fetched once per request."""
+        if self._books is None:
+            ids = [int(pk) for pk in self.data]
+            self._books = {b.pk: b for b in Book.objects.filter(pk__in=ids)} if ids else {}
+        return self._books
+
+    def lines(self, active_only=False):
+        """Cart lines with their live ``Book`` and ``line_total`` at today's price.
+
+        ``price_changed`` flags lines whose price moved since they were added.
+        """
+        books = self.books()
+        items = []
+        for pk, (qty, price, _) in self.data.items():
+            book = books.get(int(pk))
+            if book is None or (active_only and not book.is_active):
+                continue
+            items.append({
+                "book": book,
+                "qty": qty,
+                "line_total": book.price * qty,
+                "price_changed": Decimal(price) != book.price,
+            })
+        return items
+
+    def subtotal(self, active_only=False):
+        return sum((line["line_total"] for line in self.lines(active_only)), Decimal("0.00"))
+
+
+def anonymous_token(request):
+    return request.get_signed_cookie(settings.CART_COOKIE_NAME, default=None, salt=CART_COOKIE_SALT)
+
+
+def get_cart(request):
+    """The request's ``Cart``, created on first use."""
+    cart = getattr(request, "_cart", None)
+    if cart is not None:
+        return cart
+    if settings.CART_BACKEND == "session":
+        cart = Cart(SessionCartStore(request.session))
+    elif request.user.is_authenticated:
+        cart = Cart(store_for(f"user:{request.user.pk}"))
+    else:
+        token = anonymous_token(request)
+        if token:
+            cart = Cart(store_for(f"anon:{token}"))
+        else:
+            token = secrets.token_urlsafe(24)
+            cart = Cart(store_for(f"anon:{token}", exists=False))
+            cart.new_token = token
+    request._cart = cart
+    return cart
+
+
+def merge_carts(source, target):
+    """Add every line of store ``source`` to store ``target`` and empty ``source``."""
+    incoming = source.load()
+    if not incoming:
+        return
+    lines = target.load()
+    for key, (qty, price, slug) in incoming.items():
+        current = lines.get(key)
+        lines[key] = [qty + (current[0] if current else 0), price, slug]
+        target.save_line(key, lines[key])
+    source.clear()
+
+
+def expire_saved_carts(batch_size=1000):
+    """Delete ``SavedCart`` rows untouched for ``CART_TTL_DAYS``, a batch at a time.
+
+    Returns the number of carts deleted. Cached carts expire on their own.
+    """
+    from .models import SavedCart
+
+    cutoff = timezone.now() - cart_ttl()
+    deleted = 0
+    while True:
+        ids = list(SavedCart.objects.filter(updated_at__lt=cutoff).values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        # Re-checking the cutoff spares a cart that was touched since the SELECT.
+        _, per_model = SavedCart.objects.filter(pk__in=ids, updated_at__lt=cutoff).delete()
+        deleted += per_model.get(SavedCart._meta.label, 0)
@@ -1,8 +1,6 @@
+from .cart import get_cart
+
+
 def cart_count(request):
-    """Expose total quantity of items in the session cart as cart_count."""
-    cart = request.session.get("cart", {}) or {}
-    try:
-        total = sum(int(qty) for qty in cart.values())
-    except (TypeError, ValueError):
-        total = 0
-    return {"cart_count": total}
+    """Expose the cart's item count (kept in the session, no query) as cart_count."""
+    return {"cart_count": get_cart(request).count}
@@ -0,0 +1,51 @@
+"""Order fulfillment: bulk status transitions and the packing list.
+
+Orders move ``new/paid -> shipped -> delivered``. ``transition`` locks the
+eligible orders, moves them with one ``UPDATE`` by primary key and then
+queues the customer notifications for exactly those orders a batch at a
+time. ``packing_list`` totals the items of every order ready
+to pack, per book, in shelf order, with one grouped query.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from core.notify import send_status_update
+
+from .models import Order, OrderItem
+
+# Paid orders, and cash-on-delivery orders, which are paid at the door.
+READY_TO_PACK = Q(status="paid") | Q(status="new", payment__method="cod")
+SOURCES = {
+    "shipped": READY_TO_PACK,
+    "delivered": Q(status="shipped"),
+}
+NOTIFY_BATCH_SIZE = 500
+
+
+def transition(orders, status):
+    """Move the eligible orders of queryset ``orders`` to ``status``; returns how many moved."""
+    now = timezone.now()
+    with transaction.atomic():
+        # Locked, so the UPDATE moves exactly these and they are the ones notified.
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=orders.filter(SOURCES[status]).values("pk"))
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        moved = Order.objects.filter(pk__in=ids).update(status=status, updated_at=now)
+        for start in range(0, len(ids), NOTIFY_BATCH_SIZE):
+            send_status_update(ids[start:start + NOTIFY_BATCH_SIZE], status)
+    return moved
+
+
+def packing_list(orders=None):
+    """Rows of shelf, book and quantity to pick for ``orders`` (default: all ready to pack)."""
+    orders = Order.objects.filter(READY_TO_PACK) if orders is None else orders.filter(READY_TO_PACK)
+    return list(
+        OrderItem.objects.filter(order__in=orders.values("pk"))
+        .values("book_id", "book__shelf_number", "book__title", "book__isbn")
+        .annotate(quantity=Sum("quantity"), orders=Count("order", distinct=True))
+        .order_by("book__shelf_number", "book__title")
+    )
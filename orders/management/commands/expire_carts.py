@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders.cart import expire_saved_carts
+
+
+class Command(BaseCommand):
+    help = "Delete saved carts that have not been touched for CART_TTL_DAYS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = expire_saved_carts(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired carts."))
@@ -0,0 +1,92 @@
+"""Fire concurrent checkouts and check every order number is unique.
+
+Forks ``--processes`` workers (like gunicorn) that each run ``--threads``
+clients placing ``--orders`` checkouts against a throwaway book, then
+removes everything it created. Run it against a development database.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+
+from catalog.models import Book
+from orders.models import Order, ShippingMethod
+
+STRESS_ISBN = "STRESS-CHECKOUT"
+
+
+def _checkout(book_slug, method_id, count):
+    client = Client()
+    numbers = []
+    for _ in range(count):
+        client.get(f"/orders/cart/add/{book_slug}/")
+        response = client.post("/orders/checkout/", {
+            "shipping_method": method_id,
+            "full_name": "Stress Test",
+            "email": "stress@example.com",
+            "phone": "0000000000",
+            "address_line1": "1 Test Lane",
+            "city": "Accra",
+            "region": "Greater Accra",
+            "payment_method": "momo",
+        })
+        location = response.get("Location", "")
+        if "/payments/momo/start/" in location:
+            numbers.append(location.rstrip("/").rsplit("/", 1)[-1])
+        # The Mobile Money step would clear the cart; it is not followed here.
+        client.get("/orders/cart/clear/")
+    connections.close_all()
+    return numbers
+
+
+def _worker(args):
+    book_slug, method_id, threads, orders = args
+    # Never share the parent's database connections across the fork.
+    connections.close_all()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = pool.map(lambda _: _checkout(book_slug, method_id, orders), range(threads))
+    return [n for numbers in results for n in numbers]
+
+
+class Command(BaseCommand):
+    help = "Stress-test order number allocation with concurrent checkouts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--orders", type=int, default=25, help="Checkouts per thread.")
+
+    def handle(self, *args, **options):
+        processes, threads, orders = options["processes"], options["threads"], options["orders"]
+        expected = processes * threads * orders
+        method = ShippingMethod.objects.filter(is_active=True).first()
+        if method is None:
+            raise CommandError("Configure at least one active shipping method first.")
+        book = Book.objects.create(
+            title="Stress Test Book", slug="stress-test-book", isbn=STRESS_ISBN,
+            price=Decimal("1.00"), stock=expected, is_active=True,
+        )
+        connections.close_all()
+        try:
+            started = time.monotonic()
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(processes) as pool:
+                batches = pool.map(_worker, [(book.slug, method.pk, threads, orders)] * processes)
+            elapsed = time.monotonic() - started
+            numbers = [n for batch in batches for n in batch]
+            unique = len(set(numbers))
+            book.refresh_from_db()
+            self.stdout.write(
+                f"{len(numbers)}/{expected} checkouts in {elapsed:.1f}s "
+                f"({len(numbers) / elapsed:.0f}/s), {unique} unique order numbers, stock left {book.stock}."
+            )
+            if unique != len(numbers) or len(numbers) != expected or book.stock != 0:
+                raise CommandError("Stress test failed.")
+            self.stdout.write(self.style.SUCCESS("OK"))
+        finally:
+            Order.objects.filter(items__book=book).delete()
+            book.delete()
@@ -0,0 +1,25 @@
+from django.conf import settings
+
+from .cart import CART_COOKIE_SALT, cart_ttl
+
+
+class CartCookieMiddleware:
+    """Hand anonymous visitors the token of the server-side cart they just started."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cart = getattr(request, "_cart", None)
+        if cart is not None and cart.new_token and cart.written:
+            response.set_signed_cookie(
+                settings.CART_COOKIE_NAME,
+                cart.new_token,
+                salt=CART_COOKIE_SALT,
+                max_age=int(cart_ttl().total_seconds()),
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
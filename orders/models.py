@@ -20,6 +20,35 @@ class ShippingMethod(models.Model):
         return f"{self.name} (GH₵ {self.fee})"
 
 
+class NumberSequence(models.Model):
+    """Named counter handed out in blocks by orders.numbers."""
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_value}"
+
+
+class SavedCart(models.Model):
+    """Cart kept in the database (``CART_BACKEND = "db"``), owned by a user or an anonymous token."""
+    owner = models.CharField(max_length=80, unique=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return self.owner
+
+
+class SavedCartLine(models.Model):
+    cart = models.ForeignKey(SavedCart, on_delete=models.CASCADE, related_name="lines")
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    quantity = models.PositiveIntegerField()
+    # Price when the line was last changed.
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["cart", "book"], name="unique_cart_book")]
+
+
 class Order(models.Model):
     ORDER_STATUS_CHOICES = [
         ("new", "New"),
@@ -52,6 +81,13 @@ class Order(models.Model):
 
     status = models.CharField(max_length=20, choices=ORDER_STATUS_CHOICES, default="new")
 
+    class Meta:
+        indexes = [
+            # The fulfillment queue: orders in a status, oldest first.
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["created_at"]),
+        ]
+
     def __str__(self):
         return f"Order {self.order_number}"
 
@@ -0,0 +1,70 @@
+"""Order number allocation.
+
+Numbers look like ``TB2510180001234``: the ``TB`` prefix, the date, then a
+global sequence. Each worker process reserves a block of sequence values
+with one UPDATE on ``NumberSequence`` and hands them out from memory, so
+checkouts across gunicorn workers never collide and rarely touch the
+sequence row. Numbers are roughly time-ordered; blocks abandoned by a
+restarting worker just leave gaps.
+"""
+import os
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import NumberSequence
+
+SEQUENCE_NAME = "order_number"
+BLOCK_SIZE = 50
+PREFIX = "TB"
+
+
+def reserve_block(name=SEQUENCE_NAME, size=BLOCK_SIZE):
+    """Reserve ``size`` values and return the first; commits immediately.
+
+    Must run outside any surrounding transaction so the sequence row lock is
+    released right away rather than held for the caller's whole checkout.
+    """
+    # Write first: the UPDATE takes the row (or, on SQLite, database) lock up
+    # front instead of upgrading a read lock, which SQLite rejects under load.
+    with transaction.atomic():
+        updated = NumberSequence.objects.filter(name=name).update(last_value=F("last_value") + size)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    NumberSequence.objects.create(name=name, last_value=size)
+            except IntegrityError:
+                NumberSequence.objects.filter(name=name).update(last_value=F("last_value") + size)
+        last = NumberSequence.objects.filter(name=name).values_list("last_value", flat=True).get()
+    return last - size + 1
+
+
+class BlockAllocator:
+    def __init__(self, name=SEQUENCE_NAME, block_size=BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = 0
+        self._end = 0
+
+    def next_value(self):
+        with self._lock:
+            # A forked worker must not reuse its parent's block.
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._next = reserve_block(self.name, self.block_size)
+                self._end = self._next + self.block_size
+                self._pid = os.getpid()
+            value = self._next
+            self._next += 1
+            return value
+
+
+allocator = BlockAllocator()
+
+
+def next_order_number():
+    date = timezone.localdate().strftime("%y%m%d")
+    return f"{PREFIX}{date}{allocator.next_value():07d}"
@@ -0,0 +1,79 @@
+"""Checkout pricing.
+
+Active shipping methods are kept in a process-wide table, rebuilt lazily
+whenever their shared generation moves (``orders.signals`` bumps it when a
+method is saved or deleted), so checkout does not query them per request.
+Without a shared cache another worker's bump is never seen, so the table is
+then also rebuilt every ``LOCAL_TTL`` seconds.
+``quote`` prices a cart in one pass: the line totals, subtotal, shipping
+fee and total that both the checkout page and the order it places use.
+"""
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from core.cache import generations_shared, get_generations
+
+from .models import ShippingMethod
+
+ZERO = Decimal("0.00")
+LOCAL_TTL = 60
+
+Quote = namedtuple("Quote", ["lines", "subtotal", "method", "shipping_fee", "total"])
+
+
+class ShippingMethodTable:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._expires = None
+        self._methods = ()
+
+    def _stale(self, version):
+        return self._version != version or (self._expires is not None and time.monotonic() >= self._expires)
+
+    def all(self):
+        """Active methods, cheapest first."""
+        version = get_generations("shipping")
+        if self._stale(version):
+            with self._lock:
+                if self._stale(version):
+                    self._methods = tuple(ShippingMethod.objects.filter(is_active=True).order_by("fee", "name"))
+                    self._version = version
+                    self._expires = None if generations_shared() else time.monotonic() + LOCAL_TTL
+        return self._methods
+
+    def get(self, pk):
+        """The active method with ``pk``, or None."""
+        for method in self.all():
+            if method.pk == pk:
+                return method
+        return None
+
+    def default(self):
+        methods = self.all()
+        return methods[0] if methods else None
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+
+shipping_methods = ShippingMethodTable()
+
+
+def quote(cart, method=None):
+    """Price the active lines of ``cart`` with ``method``, or the cheapest one.
+
+    ``lines`` holds ``(book, qty, line_total)``; ``method`` is None when no
+    shipping method is configured.
+    """
+    method = method or shipping_methods.default()
+    lines = []
+    subtotal = ZERO
+    for item in cart.lines(active_only=True):
+        lines.append((item["book"], item["qty"], item["line_total"]))
+        subtotal += item["line_total"]
+    shipping_fee = method.fee if method else ZERO
+    return Quote(lines, subtotal, method, shipping_fee, subtotal + shipping_fee)
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.cache import bump_generation
+
+from .cart import anonymous_token, merge_carts, store_for
+from .models import ShippingMethod
+from .pricing import shipping_methods
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if settings.CART_BACKEND == "session" or request is None:
+        return
+    token = anonymous_token(request)
+    if token:
+        merge_carts(store_for(f"anon:{token}"), store_for(f"user:{user.pk}"))
+    # Whatever was loaded for the anonymous visitor is stale now.
+    request._cart = None
+
+
+@receiver(post_save, sender=ShippingMethod)
+@receiver(post_delete, sender=ShippingMethod)
+def invalidate_shipping_methods(sender, **kwargs):
+    def invalidate():
+        bump_generation("shipping")
+        shipping_methods.invalidate()
+
+    transaction.on_commit(invalidate)
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from .cart import expire_saved_carts
+
+
+@shared_task
+def expire_carts():
+    return expire_saved_carts()
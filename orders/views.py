@@ -1,18 +1,43 @@
 from django.contrib import messages
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView, View
 
-from catalog.models import Book
-from .models import Order, OrderItem, ShippingMethod
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from catalog.models import Book, StockMovement
+from .cart import get_cart
+from .models import Order, OrderItem
+from .numbers import next_order_number
+from .pricing import quote, shipping_methods
 from payments.models import Payment
+from core.cache import bump_generation
+from core.idempotency import header_key, idempotent, keep
 from core.notify import send_order_email, send_sms
 from decimal import Decimal
-import datetime
+import uuid
+
 
+class InsufficientStock(Exception):
+    def __init__(self, book, qty):
+        super().__init__(f"Only {book.stock} of {book.title} left, {qty} requested")
+        self.book = book
+        self.qty = qty
 
-def _get_cart(session):
-    return session.setdefault("cart", {})
+
+def _clamp_cart(request, short_lines):
+    """Lower cart quantities to the stock actually left and tell the customer."""
+    cart = get_cart(request)
+    for book, qty in short_lines:
+        if book.stock > 0:
+            cart.set_quantity(book, book.stock)
+            messages.error(request, f"Only {book.stock} of {book.title} left; your cart has been updated.")
+        else:
+            cart.remove(book.pk)
+            messages.error(request, f"Sorry, {book.title} just sold out and was removed from your cart.")
 
 
 class CartView(TemplateView):
@@ -20,106 +45,90 @@ class CartView(TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        cart = _get_cart(self.request.session)
-        items = []
-        total = 0
-        if cart:
-            books = Book.objects.filter(slug__in=cart.keys())
-            book_map = {b.slug: b for b in books}
-            for slug, qty in cart.items():
-                book = book_map.get(slug)
-                if not book:
-                    continue
-                line_total = book.price * qty
-                total += line_total
-                items.append({"book": book, "qty": qty, "line_total": line_total})
+        items = get_cart(self.request).lines()
         ctx["items"] = items
-        ctx["total"] = total
+        ctx["total"] = sum((it["line_total"] for it in items), Decimal("0.00"))
         return ctx
 
 
 def add_to_cart(request, slug):
-    book = get_object_or_404(Book, slug=slug, is_active=True)
+    # Only what the cart and the messages need; stock must be read live.
+    book = get_object_or_404(Book.objects.only("pk", "slug", "title", "price", "stock"), slug=slug, is_active=True)
     if not book.in_stock:
         messages.error(request, "This book is currently out of stock.")
         return redirect(book.get_absolute_url())
-    cart = _get_cart(request.session)
-    current_qty = int(cart.get(slug, 0))
+    cart = get_cart(request)
+    current_qty = cart.quantity(book.pk)
     if current_qty >= book.stock:
         messages.info(request, f"You already have the maximum available quantity ({book.stock}) of this title in your cart.")
     else:
-        new_qty = current_qty + 1
-        if new_qty > book.stock:
-            new_qty = book.stock
-        cart[slug] = new_qty
+        new_qty = min(current_qty + 1, book.stock)
+        cart.set_quantity(book, new_qty)
         messages.success(request, f"Added to cart: {book.title} (x{new_qty}).")
-    request.session.modified = True
     return redirect("orders:cart")
 
 
 def remove_from_cart(request, slug):
-    cart = _get_cart(request.session)
-    if slug in cart:
-        del cart[slug]
-        request.session.modified = True
+    cart = get_cart(request)
+    if cart.remove(cart.book_id_for(slug)):
         messages.info(request, "Item removed from cart.")
     return redirect("orders:cart")
 
 
 def decrease_quantity(request, slug):
-    cart = _get_cart(request.session)
-    if slug in cart:
-        new_qty = int(cart[slug]) - 1
+    cart = get_cart(request)
+    book_id = cart.book_id_for(slug)
+    if book_id is not None:
+        new_qty = cart.decrease(book_id)
         if new_qty <= 0:
-            del cart[slug]
             messages.info(request, "Item removed from cart.")
         else:
-            cart[slug] = new_qty
             messages.info(request, f"Updated quantity to {new_qty}.")
-        request.session.modified = True
     return redirect("orders:cart")
 
 
 def clear_cart(request):
-    request.session["cart"] = {}
-    request.session.modified = True
+    get_cart(request).clear()
     messages.info(request, "Cart cleared.")
     return redirect("orders:cart")
 
 
+def checkout_key(request):
+    # The form carries a key minted when the checkout page was rendered.
+    return request.POST.get("idempotency_key") or header_key(request)
+
+
+@method_decorator(idempotent("checkout", checkout_key, wait=10), name="post")
 class CheckoutView(View):
     template_name = "orders/checkout.html"
 
     def get(self, request):
-        cart = _get_cart(request.session)
+        cart = get_cart(request)
         if not cart:
             messages.info(request, "Your cart is empty.")
             return redirect("orders:cart")
-        methods = ShippingMethod.objects.filter(is_active=True).order_by("fee")
-        if not methods.exists():
+        methods = shipping_methods.all()
+        if not methods:
             messages.error(request, "No delivery methods configured. Please contact the shop.")
-        # compute subtotal
-        subtotal = Decimal("0.00")
-        books = Book.objects.filter(slug__in=cart.keys())
-        for b in books:
-            subtotal += Decimal(b.price) * cart.get(b.slug, 0)
-        default_fee = Decimal(str(methods.first().fee)) if methods.exists() else Decimal("0.00")
+        priced = quote(cart)
         return render(request, self.template_name, {
             "shipping_methods": methods,
-            "subtotal": subtotal,
-            "subtotal_plus_shipping": subtotal + default_fee,
-            "default_shipping_fee": default_fee,
+            "subtotal": priced.subtotal,
+            "subtotal_plus_shipping": priced.total,
+            "default_shipping_fee": priced.shipping_fee,
+            "idempotency_key": uuid.uuid4().hex,
         })
 
     def post(self, request):
-        cart = _get_cart(request.session)
+        cart = get_cart(request)
         if not cart:
             messages.info(request, "Your cart is empty.")
             return redirect("orders:cart")
         try:
-            method_id = int(request.POST.get("shipping_method"))
-            method = ShippingMethod.objects.get(pk=method_id, is_active=True)
-        except (TypeError, ValueError, ShippingMethod.DoesNotExist):
+            method = shipping_methods.get(int(request.POST.get("shipping_method")))
+        except (TypeError, ValueError):
+            method = None
+        if method is None:
             messages.error(request, "Please select a valid delivery option.")
             return redirect("orders:checkout")
 
@@ -136,72 +145,94 @@ class CheckoutView(View):
             messages.error(request, "Please complete the required fields.")
             return redirect("orders:checkout")
 
-        # compute totals
-        subtotal = Decimal("0.00")
-        books = Book.objects.filter(slug__in=cart.keys())
-        book_map = {b.slug: b for b in books}
-        for slug, qty in cart.items():
-            b = book_map.get(slug)
-            if not b:
-                continue
-            subtotal += Decimal(b.price) * int(qty)
-        shipping_fee = Decimal(method.fee)
-        total = subtotal + shipping_fee
-
-        # create order
-        ts = datetime.datetime.now().strftime("%y%m%d%H%M%S")
-        order_number = f"TB{ts}"
-        order = Order.objects.create(
-            order_number=order_number,
-            user=request.user if request.user.is_authenticated else None,
-            email=email,
-            full_name=full_name,
-            phone=phone,
-            address_line1=address_line1,
-            address_line2=address_line2,
-            city=city,
-            region=region,
-            notes=notes,
-            shipping_method=method,
-            subtotal=subtotal,
-            shipping_fee=shipping_fee,
-            total=total,
-        )
-
-        # create items and adjust stock
-        for slug, qty in cart.items():
-            b = book_map.get(slug)
-            if not b:
-                continue
-            qty = int(qty)
-            OrderItem.objects.create(
-                order=order,
-                book=b,
-                title=b.title,
-                unit_price=b.price,
-                quantity=qty,
-                line_total=Decimal(b.price) * qty,
-            )
-            if b.stock >= qty:
-                b.stock -= qty
-                b.save(update_fields=["stock"])
-
-        # payment selection
+        # re-validate the cart against live stock
+        priced = quote(cart, method)
+        lines = [(b, qty) for b, qty, _ in priced.lines]
+        if not lines:
+            cart.clear()
+            messages.error(request, "The books in your cart are no longer available.")
+            return redirect("orders:cart")
+        short = [(b, qty) for b, qty in lines if b.stock < qty]
+        if short:
+            _clamp_cart(request, short)
+            return redirect("orders:cart")
+
         pay_method = request.POST.get("payment_method", "momo")  # default momo
+        # Allocated before the transaction so the sequence row is never held
+        # locked for the length of a checkout.
+        order_number = next_order_number()
+
+        try:
+            with transaction.atomic():
+                # Reserve stock with conditional updates; a concurrent checkout
+                # that got there first makes the update match no row. Lock rows
+                # in primary key order so concurrent checkouts cannot deadlock.
+                now = timezone.now()
+                for b, qty in sorted(lines, key=lambda line: line[0].pk):
+                    reserved = Book.objects.filter(pk=b.pk, stock__gte=qty).update(
+                        stock=F("stock") - qty, updated_at=now
+                    )
+                    if not reserved:
+                        raise InsufficientStock(b, qty)
+                StockMovement.objects.bulk_create([
+                    StockMovement(book=b, delta=-qty, reason="sale", reference=order_number)
+                    for b, qty in lines
+                ])
+
+                # create order
+                order = Order.objects.create(
+                    order_number=order_number,
+                    user=request.user if request.user.is_authenticated else None,
+                    email=email,
+                    full_name=full_name,
+                    phone=phone,
+                    address_line1=address_line1,
+                    address_line2=address_line2,
+                    city=city,
+                    region=region,
+                    notes=notes,
+                    shipping_method=method,
+                    subtotal=priced.subtotal,
+                    shipping_fee=priced.shipping_fee,
+                    total=priced.total,
+                )
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        book=b,
+                        title=b.title,
+                        unit_price=b.price,
+                        quantity=qty,
+                        line_total=line_total,
+                    )
+                    for b, qty, line_total in priced.lines
+                ])
+
+                # payment selection
+                if pay_method == "cod":
+                    # Cash on Delivery: consider order placed without payment now
+                    Payment.objects.create(order=order, method="cod", provider="cod", status="authorized", amount=order.total)
+                else:
+                    Payment.objects.create(order=order, method="momo", provider="mtn-voda-at", status="pending", amount=order.total)
+                # Stock updates bypass save signals. Cached pages only show in or out
+                # of stock, so they go stale only when a line sold the last copy.
+                if Book.objects.filter(pk__in=[b.pk for b, _ in lines], stock__lte=0).exists():
+                    transaction.on_commit(lambda: bump_generation("book"))
+        except InsufficientStock as exc:
+            live = Book.objects.filter(pk=exc.book.pk).values_list("stock", flat=True).first() or 0
+            exc.book.stock = live
+            _clamp_cart(request, [(exc.book, exc.qty)])
+            return redirect("orders:cart")
+
         if pay_method == "cod":
-            # Cash on Delivery: consider order placed without payment now
-            Payment.objects.create(order=order, method="cod", provider="cod", status="authorized", amount=order.total)
-            # clear cart
-            request.session["cart"] = {}
-            request.session.modified = True
+            cart.clear()
             # notifications
             send_order_email(order, subject_prefix="Order Placed (COD)")
             send_sms(order.phone, f"TBSS: Order {order.order_number} placed. Pay on delivery. Total GH₵ {order.total}.")
-            return redirect(reverse("orders:success", kwargs={"order_number": order.order_number}))
+            return keep(redirect(reverse("orders:success", kwargs={"order_number": order.order_number})))
         else:
             # Start Mobile Money payment
-            Payment.objects.create(order=order, method="momo", provider="mtn-voda-at", status="pending", amount=order.total)
-            return redirect(reverse("payments:momo_start", kwargs={"order_number": order.order_number}))
+            return keep(redirect(reverse("payments:momo_start", kwargs={"order_number": order.order_number})))
 
 
 class OrderSuccessView(TemplateView):
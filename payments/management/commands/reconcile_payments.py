@@ -0,0 +1,60 @@
+import csv
+import sys
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from payments.reconcile import CHUNK_SIZE, Discrepancy, ReconcileResult, Reconciler, read_csv, read_json
+
+
+def _day_start(value):
+    day = parse_date(value)
+    if day is None:
+        raise CommandError(f"Cannot parse {value!r} as a date.")
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Command(BaseCommand):
+    help = "Reconcile Mobile Money payments against a provider settlement report (CSV, JSON Lines or JSON array)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Settlement report, or - for stdin.")
+        parser.add_argument("--format", choices=["csv", "json"], help="Defaults from the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing.")
+        parser.add_argument("--report", help="Write discrepancies to this CSV instead of stdout.")
+        parser.add_argument("--since", help="With --until, also report paid payments from these dates missing from the report.")
+        parser.add_argument("--until", help="End date (exclusive) for --since.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("json" if path.endswith((".json", ".jsonl", ".ndjson")) else "csv")
+        if bool(options["since"]) != bool(options["until"]):
+            raise CommandError("--since and --until go together.")
+
+        report_file = open(options["report"], "w", newline="", encoding="utf-8") if options["report"] else self.stdout
+        source = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+        try:
+            report = csv.writer(report_file)
+            report.writerow(Discrepancy._fields)
+            result = ReconcileResult(report, track_matched=bool(options["since"]))
+            reconciler = Reconciler(chunk_size=options["chunk_size"], dry_run=options["dry_run"])
+            rows = read_json(source) if fmt == "json" else read_csv(source)
+            try:
+                reconciler.run(rows, result)
+            except (ValueError, csv.Error) as exc:
+                raise CommandError(f"Could not read {path} after {result.rows} rows: {exc}")
+            if options["since"]:
+                reconciler.report_missing(result, _day_start(options["since"]), _day_start(options["until"]))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if report_file is not self.stdout:
+                report_file.close()
+
+        for kind, count in sorted(result.counts.items()):
+            self.stderr.write(f"{count:>8}  {kind.replace('_', ' ')}")
+        prefix = "Dry run: " if options["dry_run"] else ""
+        self.stderr.write(self.style.SUCCESS(prefix + result.summary()))
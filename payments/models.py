@@ -8,11 +8,15 @@ class Payment(models.Model):
         ("momo", "Mobile Money"),
         ("cod", "Cash on Delivery"),
     )
+    # Mobile Money moves pending -> prompted -> paid/failed/expired (see
+    # payments.momo); cash on delivery is authorized at checkout.
     STATUS_CHOICES = (
         ("pending", "Pending"),
+        ("prompted", "Prompted"),
         ("authorized", "Authorized"),
         ("paid", "Paid"),
         ("failed", "Failed"),
+        ("expired", "Expired"),
         ("cancelled", "Cancelled"),
     )
 
@@ -21,9 +25,17 @@ class Payment(models.Model):
     provider = models.CharField(max_length=50)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    reference = models.CharField(max_length=100, blank=True)
+    # The provider's transaction id.
+    reference = models.CharField(max_length=100, blank=True, db_index=True)
+    prompted_at = models.DateTimeField(null=True, blank=True)
+    # Set when a prompt is requested; unanswered prompts expire after it.
+    expires_at = models.DateTimeField(null=True, blank=True)
+    failure_reason = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["status", "expires_at"])]
+
     def __str__(self):
         return f"Payment {self.order.order_number} - {self.status}"
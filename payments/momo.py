@@ -0,0 +1,254 @@
+"""Mobile Money collections.
+
+A MoMo payment moves ``pending -> prompted -> paid``, or to ``failed`` or
+``expired``. ``start`` marks a payment as waiting for a prompt. A worker
+then asks the provider to push the USSD prompt (``payments.tasks``), so no
+request waits on the customer's phone. The provider reports the outcome
+to a signed callback. Every transition is a conditional UPDATE from the
+states allowed to reach it, so repeated callbacks, a late callback racing
+the expiry sweep and double-clicked retries all change the row at most once.
+
+A payment left failed or expired for ``MOMO_RELEASE_AFTER`` seconds is
+given up on: ``release_unpaid_orders`` cancels it and its order and puts the
+reserved stock back.
+
+A provider's approval is final, as long as the amount and currency it
+reports (when it reports them) are the ones we asked for. It can turn a payment that we already
+gave up on (failed or expired) into a paid one. A failure only applies to
+the attempt it names, so a late FAILED from an earlier prompt cannot fail
+a retry.
+"""
+import hashlib
+import hmac
+import json
+import logging
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from urllib import request as urlrequest
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from catalog.inventory import release_stock
+from core.notify import send_order_email, send_sms
+from orders.models import Order, OrderItem
+
+from .models import Payment
+
+log = logging.getLogger("tbss.momo")
+
+CURRENCY = "GHS"
+OPEN = ("pending", "prompted")
+GIVEN_UP = ("failed", "expired")
+# The customer may approve after we stopped waiting; money taken is money taken.
+PAYABLE = OPEN + GIVEN_UP
+TRANSITIONS = {
+    "pending": GIVEN_UP,  # a retry
+    "prompted": ("pending",),
+    "paid": PAYABLE,
+    "failed": OPEN,
+    "expired": OPEN,
+}
+# Outcome strings a provider may send, mapped onto our states.
+PROVIDER_STATUSES = {
+    "SUCCESSFUL": "paid",
+    "SUCCESS": "paid",
+    "PAID": "paid",
+    "FAILED": "failed",
+    "REJECTED": "failed",
+    "CANCELLED": "failed",
+    "EXPIRED": "expired",
+    "TIMEOUT": "expired",
+}
+
+
+class ProviderError(Exception):
+    pass
+
+
+def sign(body):
+    """Hex HMAC-SHA256 of ``body`` with ``MOMO_WEBHOOK_SECRET``."""
+    return hmac.new(settings.MOMO_WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def verify(body, signature):
+    if not settings.MOMO_WEBHOOK_SECRET or not signature:
+        return False
+    return hmac.compare_digest(sign(body), signature)
+
+
+def transition(payment, status, attempt=None, **fields):
+    """Move ``payment`` to ``status`` if its current state allows it.
+
+    With ``attempt``, the payment must also still carry that provider
+    reference. Returns False, changing nothing, when another request got
+    there first. On success the instance is updated and the side effects
+    run on commit.
+    """
+    if status == "paid":
+        # A failure from an earlier attempt no longer applies.
+        fields["failure_reason"] = ""
+    rows = Payment.objects.filter(pk=payment.pk, status__in=TRANSITIONS[status])
+    if attempt is not None:
+        rows = rows.filter(reference=attempt)
+    changed = rows.update(
+        status=status, updated_at=timezone.now(), **fields
+    )
+    if not changed:
+        return False
+    payment.status = status
+    for name, value in fields.items():
+        setattr(payment, name, value)
+    if status == "paid":
+        _on_paid(payment)
+    return True
+
+
+def _on_paid(payment):
+    order = payment.order
+    Order.objects.filter(pk=order.pk, status="new").update(status="paid")
+    send_order_email(order, subject_prefix="Order Paid")
+    send_sms(order.phone, f"TBSS: Payment received for order {order.order_number}. Thank you!")
+
+
+def start(payment):
+    """Queue a prompt for a new, failed or expired payment; False if one is already open."""
+    from .tasks import request_momo_prompt
+
+    expires_at = timezone.now() + timedelta(seconds=settings.MOMO_PROMPT_TTL)
+    if payment.status == "pending" and payment.expires_at is None:
+        started = Payment.objects.filter(pk=payment.pk, status="pending", expires_at__isnull=True).update(
+            expires_at=expires_at
+        )
+    else:
+        started = transition(payment, "pending", expires_at=expires_at, reference="", failure_reason="")
+    if started:
+        payment.expires_at = expires_at
+        transaction.on_commit(lambda: request_momo_prompt.delay(payment.pk))
+    return bool(started)
+
+
+def request_prompt(payment, callback_url):
+    """Ask the provider to prompt the customer's phone; returns its reference."""
+    if not settings.MOMO_API_URL:
+        raise ProviderError("MOMO_API_URL is not configured")
+    order = payment.order
+    body = json.dumps({
+        "external_id": order.order_number,
+        "amount": str(payment.amount),
+        "currency": CURRENCY,
+        "phone": order.phone,
+        "callback_url": callback_url,
+    }).encode("utf-8")
+    req = urlrequest.Request(
+        url=settings.MOMO_API_URL,
+        data=body,
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {settings.MOMO_API_KEY}"},
+        method="POST",
+    )
+    with urlrequest.urlopen(req, timeout=10) as response:
+        data = json.loads(response.read() or b"{}")
+    reference = data.get("reference")
+    if not reference:
+        raise ProviderError(f"no reference in provider response: {data!r}")
+    return reference
+
+
+def _amount_mismatch(payment, data):
+    """Why the callback's amount or currency is not what we asked for, or ""."""
+    if data.get("currency") not in (None, "") and str(data["currency"]).strip().upper() != CURRENCY:
+        return f"currency {data['currency']!r}, expected {CURRENCY}"
+    if data.get("amount") not in (None, ""):
+        try:
+            amount = Decimal(str(data["amount"]).strip())
+        except InvalidOperation:
+            amount = None
+        if amount != payment.amount:
+            return f"amount {data['amount']!r}, expected {payment.amount}"
+    return ""
+
+
+def handle_callback(data):
+    """Apply a verified callback. Returns the payment, or None if it is not ours.
+
+    Callbacks for payments already settled are accepted and ignored. An
+    approval for the wrong amount or currency is logged and left for the
+    settlement report; the payment is not marked paid.
+    """
+    payment = (
+        Payment.objects.select_related("order")
+        .filter(order__order_number=data.get("external_id"), method="momo")
+        .first()
+    )
+    if payment is None:
+        return None
+    status = PROVIDER_STATUSES.get(str(data.get("status", "")).upper())
+    if status is None:
+        raise ValueError(f"unknown status {data.get('status')!r}")
+    reference = str(data.get("reference") or "")[:100]
+    if status == "paid":
+        mismatch = _amount_mismatch(payment, data)
+        if mismatch:
+            log.error("MoMo approval for order %s ignored: %s", payment.order.order_number, mismatch)
+            return payment
+    with transaction.atomic():
+        if status == "paid":
+            changed = transition(payment, status, **({"reference": reference} if reference else {}))
+        else:
+            reason = str(data.get("reason") or f"The provider reported {data.get('status')}.")[:255]
+            # Only the attempt that failed; a retry has a new (or not yet known) reference.
+            changed = transition(payment, status, attempt=reference or None, failure_reason=reason)
+    if not changed:
+        payment.refresh_from_db(fields=["status"])
+    return payment
+
+
+def expire_payments(batch_size=500):
+    """Expire open prompts past ``expires_at``, a batch per statement. Returns the count."""
+    now = timezone.now()
+    expired = 0
+    while True:
+        ids = list(
+            Payment.objects.filter(status__in=OPEN, expires_at__lt=now).values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return expired
+        # The status filter again, so a payment settled since the SELECT is left alone.
+        expired += Payment.objects.filter(pk__in=ids, status__in=OPEN).update(
+            status="expired", failure_reason="No approval before the prompt timed out.", updated_at=now
+        )
+
+
+def release_unpaid_orders(batch_size=500):
+    """Cancel orders whose MoMo payment failed or expired ``MOMO_RELEASE_AFTER`` ago.
+
+    Their stock goes back on the shelf. Returns the number of orders cancelled.
+    """
+    now = timezone.now()
+    stale = Payment.objects.filter(
+        method="momo",
+        status__in=GIVEN_UP,
+        updated_at__lt=now - timedelta(seconds=settings.MOMO_RELEASE_AFTER),
+        order__status="new",
+    )
+    released = 0
+    while True:
+        with transaction.atomic():
+            # Locked with their orders, so a retry or late approval either got in
+            # first (and the row no longer matches) or waits and finds it cancelled.
+            rows = list(
+                stale.select_for_update().order_by("pk").values_list("pk", "order_id", "order__order_number")[:batch_size]
+            )
+            if not rows:
+                return released
+            Payment.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(status="cancelled", updated_at=now)
+            orders = {order_id: number for _, order_id, number in rows}
+            Order.objects.filter(pk__in=orders).update(status="cancelled", updated_at=now)
+            release_stock([
+                (book_id, quantity, orders[order_id])
+                for order_id, book_id, quantity in OrderItem.objects.filter(order_id__in=orders)
+                .order_by("pk")
+                .values_list("order_id", "book_id", "quantity")
+            ])
+        released += len(orders)
@@ -0,0 +1,191 @@
+"""Reconcile payments against a provider settlement report.
+
+The report is read as a stream: a CSV with ``reference``, ``status`` and
+``amount`` columns, JSON Lines, or a JSON array of such objects. It is
+handled in chunks. For each chunk, the payments it mentions are loaded
+into a ``{reference: row}`` index with one query. Status changes are then
+applied with a few set-based UPDATEs in one transaction per chunk, so
+memory stays bounded by the chunk size rather than the report.
+
+Payments the provider settled but we still have as open, failed or expired
+become paid, and their orders paid with them; those customers are notified
+in batches once the chunk commits. Open payments the provider
+failed become failed. Everything that cannot be applied safely (amount
+mismatches, settled payments the provider now reports failed, unknown
+references) is reported as a discrepancy rather than changed.
+"""
+import csv
+import json
+import re
+from collections import Counter, namedtuple
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.notify import send_status_update
+from orders.models import Order
+
+from .models import Payment
+from .momo import OPEN, PAYABLE, PROVIDER_STATUSES
+
+CHUNK_SIZE = 2000
+NOTIFY_BATCH_SIZE = 500
+
+SEPARATORS = re.compile(r"[\s,]*")
+Discrepancy = namedtuple("Discrepancy", ["line", "reference", "kind", "detail"])
+
+
+def read_csv(fileobj):
+    for line, row in enumerate(csv.DictReader(fileobj), start=2):
+        yield line, row
+
+
+def read_json(fileobj, buffer_size=64 * 1024):
+    """Yield ``(n, object)`` from JSON Lines or a top-level JSON array, without loading it whole."""
+    decoder = json.JSONDecoder()
+    buf = fileobj.read(buffer_size).lstrip()
+    pos = 1 if buf.startswith("[") else 0
+    n = 0
+    while True:
+        pos = SEPARATORS.match(buf, pos).end()
+        if buf.startswith("]", pos):
+            return
+        try:
+            obj, pos_after = decoder.raw_decode(buf, pos)
+        except ValueError:
+            more = fileobj.read(buffer_size)
+            if not more:
+                if buf[pos:].strip():
+                    raise ValueError(f"malformed or truncated JSON after object {n}")
+                return
+            buf, pos = buf[pos:] + more, 0
+            continue
+        n += 1
+        yield n, obj
+        pos = pos_after
+
+
+class ReconcileResult:
+    def __init__(self, report=None, track_matched=False):
+        self.rows = 0
+        self.matched = 0
+        self.counts = Counter()
+        # Discrepancies are written to ``report`` as they are found; only counts are kept.
+        self.report = report
+        # Only needed for report_missing; ids are small next to the report rows.
+        self.matched_ids = set() if track_matched else None
+
+    def discrepancy(self, line, reference, kind, detail=""):
+        self.counts[kind] += 1
+        if self.report is not None:
+            self.report.writerow(Discrepancy(line, reference, kind, detail))
+
+    def summary(self):
+        applied = ", ".join(f"{self.counts[k]} {k.replace('_', ' ')}" for k in ("marked_paid", "marked_failed"))
+        problems = sum(n for k, n in self.counts.items() if k not in ("marked_paid", "marked_failed"))
+        return f"{self.rows} settlement rows, {self.matched} matched; {applied}; {problems} discrepancies."
+
+
+class Reconciler:
+    def __init__(self, chunk_size=CHUNK_SIZE, dry_run=False):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+
+    def run(self, rows, result):
+        """Reconcile ``(line, mapping)`` pairs and return ``result``."""
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return result
+            with transaction.atomic():
+                self.reconcile_chunk(chunk, result)
+
+    def reconcile_chunk(self, chunk, result):
+        settled = {}
+        for line, row in chunk:
+            result.rows += 1
+            if not isinstance(row, dict):
+                result.discrepancy(line, "", "unreadable", repr(row)[:200])
+                continue
+            reference = str(row.get("reference") or "").strip()
+            status = PROVIDER_STATUSES.get(str(row.get("status") or "").strip().upper())
+            try:
+                amount = Decimal(str(row.get("amount")).strip())
+            except (InvalidOperation, ValueError):
+                amount = None
+            if not reference or status is None or amount is None:
+                result.discrepancy(line, reference, "unreadable", json.dumps(row, default=str)[:200])
+                continue
+            if reference in settled:
+                result.discrepancy(line, reference, "duplicate", f"also on line {settled[reference][0]}")
+            settled[reference] = (line, status, amount)
+        if not settled:
+            return
+
+        index = {
+            p["reference"]: p
+            for p in Payment.objects.filter(reference__in=settled).values("pk", "reference", "status", "amount", "order_id")
+        }
+        to_paid, to_failed = [], []
+        for reference, (line, status, amount) in settled.items():
+            payment = index.get(reference)
+            if payment is None:
+                result.discrepancy(line, reference, "unknown_reference")
+                continue
+            result.matched += 1
+            if result.matched_ids is not None:
+                result.matched_ids.add(payment["pk"])
+            if amount != payment["amount"]:
+                result.discrepancy(line, reference, "amount_mismatch", f"settled {amount}, expected {payment['amount']}")
+                continue
+            if status == "paid":
+                if payment["status"] in PAYABLE:
+                    to_paid.append(payment["pk"])
+                    if payment["status"] not in OPEN:
+                        result.discrepancy(line, reference, "paid_after_" + payment["status"])
+                elif payment["status"] != "paid":
+                    # Cancelled and its stock released; refund or re-ship by hand.
+                    result.discrepancy(line, reference, "paid_after_" + payment["status"], "order cancelled")
+            elif payment["status"] == "paid":
+                result.discrepancy(line, reference, "settled_as_" + status, "we recorded it as paid")
+            elif payment["status"] in OPEN:
+                to_failed.append(payment["pk"])
+
+        if self.dry_run:
+            result.counts["marked_paid"] += len(to_paid)
+            result.counts["marked_failed"] += len(to_failed)
+            return
+        now = timezone.now()
+        # Locked first, so exactly these move and their customers hear about it once.
+        paid = list(
+            Payment.objects.select_for_update().filter(pk__in=to_paid, status__in=PAYABLE).values_list("pk", "order_id")
+        )
+        result.counts["marked_paid"] += Payment.objects.filter(pk__in=[pk for pk, _ in paid]).update(
+            status="paid", failure_reason="", updated_at=now
+        )
+        order_ids = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=[order_id for _, order_id in paid], status="new")
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        Order.objects.filter(pk__in=order_ids).update(status="paid", updated_at=now)
+        for start in range(0, len(order_ids), NOTIFY_BATCH_SIZE):
+            send_status_update(order_ids[start:start + NOTIFY_BATCH_SIZE], "paid")
+        result.counts["marked_failed"] += Payment.objects.filter(pk__in=to_failed, status__in=OPEN).update(
+            status="failed", failure_reason="Reported failed in the settlement report.", updated_at=now
+        )
+
+    def report_missing(self, result, since, until):
+        """Report our paid MoMo payments in ``[since, until)`` that the report never mentioned."""
+        paid = (
+            Payment.objects.filter(method="momo", status="paid", created_at__gte=since, created_at__lt=until)
+            .values_list("pk", "reference")
+            .order_by("pk")
+        )
+        for pk, reference in paid.iterator(chunk_size=self.chunk_size):
+            if pk not in result.matched_ids:
+                result.discrepancy(None, reference, "missing_from_settlement", f"payment {pk}")
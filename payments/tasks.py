@@ -0,0 +1,44 @@
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from core.tasks import can_retry
+
+from . import momo
+from .models import Payment
+
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 5  # seconds; doubles on every attempt
+
+
+def callback_url():
+    return settings.SITE_URL.rstrip("/") + reverse("payments:momo_callback")
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES)
+def request_momo_prompt(self, payment_id):
+    payment = Payment.objects.select_related("order").filter(pk=payment_id).first()
+    if payment is None or payment.status != "pending":
+        return False
+    try:
+        reference = momo.request_prompt(payment, callback_url())
+    except (OSError, ValueError, momo.ProviderError) as exc:
+        if can_retry(self):
+            raise self.retry(exc=exc, countdown=RETRY_BASE_DELAY * 2 ** self.request.retries)
+        with transaction.atomic():
+            momo.transition(payment, "failed", failure_reason=f"Could not reach the provider: {exc}"[:255])
+        return False
+    with transaction.atomic():
+        return momo.transition(payment, "prompted", reference=reference, prompted_at=timezone.now())
+
+
+@shared_task
+def expire_momo_payments():
+    return momo.expire_payments()
+
+
+@shared_task
+def release_unpaid_momo_orders():
+    return momo.release_unpaid_orders()
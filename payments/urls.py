@@ -1,9 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from .views import PaymentsIndexView, momo_start
+from .views import PaymentsIndexView, momo_callback, momo_sandbox, momo_start, momo_status, momo_wait
 
 app_name = "payments"
 
 urlpatterns = [
     path("", PaymentsIndexView.as_view(), name="index"),
     path("momo/start/<str:order_number>/", momo_start, name="momo_start"),
+    path("momo/wait/<str:order_number>/", momo_wait, name="momo_wait"),
+    path("momo/status/<str:order_number>/", momo_status, name="momo_status"),
+    path("momo/callback/", momo_callback, name="momo_callback"),
 ]
+
+if settings.MOMO_SANDBOX:
+    urlpatterns += [path("dev/momo/", momo_sandbox, name="momo_sandbox")]
@@ -1,10 +1,27 @@
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from urllib import request as urlrequest
+
 from django.contrib import messages
-from django.shortcuts import get_object_or_404, redirect
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 
+from orders.cart import get_cart
+from core.idempotency import idempotent
 from orders.models import Order
 from .models import Payment
-from core.notify import send_order_email, send_sms
+from . import momo
+
+momo_log = logging.getLogger("tbss.momo")
 
 
 class PaymentsIndexView(TemplateView):
@@ -12,24 +29,105 @@ class PaymentsIndexView(TemplateView):
 
 
 def momo_start(request, order_number: str):
+    """Queue the USSD prompt and send the customer to the page that waits for it."""
     order = get_object_or_404(Order, order_number=order_number)
     payment = getattr(order, "payment", None)
     if not payment:
         payment = Payment.objects.create(order=order, method="momo", provider="mtn-voda-at", status="pending", amount=order.total)
+    if payment.status == "paid":
+        return redirect("orders:success", order_number=order.order_number)
+    if payment.method == "momo":
+        with transaction.atomic():
+            momo.start(payment)
+
+    # The order is placed and its stock reserved; the cart has served its purpose.
+    get_cart(request).clear()
+    return redirect("payments:momo_wait", order_number=order.order_number)
+
+
+def momo_wait(request, order_number: str):
+    payment = get_object_or_404(Payment.objects.select_related("order"), order__order_number=order_number)
+    if payment.status == "paid":
+        messages.success(request, "Payment successful via Mobile Money.")
+        return redirect("orders:success", order_number=order_number)
+    return render(request, "payments/momo_wait.html", {"payment": payment, "order": payment.order})
+
+
+@never_cache
+def momo_status(request, order_number: str):
+    """Polled by the waiting page: one indexed lookup, no template."""
+    row = (
+        Payment.objects.filter(order__order_number=order_number)
+        .values("status", "failure_reason")
+        .first()
+    )
+    if row is None:
+        return JsonResponse({"error": "not found"}, status=404)
+    if row["status"] == "paid":
+        row["redirect"] = reverse("orders:success", kwargs={"order_number": order_number})
+    return JsonResponse(row)
+
+
+def callback_key(request):
+    # Providers retry with the same body; an explicit key wins if they send one.
+    return request.headers.get("Idempotency-Key") or hashlib.sha256(request.body).hexdigest()
+
+
+@csrf_exempt
+@require_POST
+@idempotent("momo-callback", callback_key)
+def momo_callback(request):
+    """Provider webhook; the body must carry a valid ``X-Momo-Signature``."""
+    if not momo.verify(request.body, request.headers.get("X-Momo-Signature", "")):
+        return JsonResponse({"error": "bad signature"}, status=403)
+    try:
+        data = json.loads(request.body)
+        payment = momo.handle_callback(data)
+    except (ValueError, AttributeError) as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    if payment is None:
+        return JsonResponse({"error": "unknown payment"}, status=404)
+    return JsonResponse({"status": payment.status})
+
 
-    # In a real integration, call provider API and redirect to approval or prompt USSD.
-    # For now, simulate immediate success.
-    payment.status = "paid"
-    payment.reference = f"SIM-{order.order_number}"
-    payment.save(update_fields=["status", "reference"])
+def _sandbox_callback(url, payload):
+    body = json.dumps(payload).encode("utf-8")
+    req = urlrequest.Request(
+        url=url,
+        data=body,
+        headers={"Content-Type": "application/json", "X-Momo-Signature": momo.sign(body)},
+        method="POST",
+    )
+    try:
+        urlrequest.urlopen(req, timeout=5)
+    except OSError as exc:
+        momo_log.warning("Sandbox callback failed: %s", exc)
 
-    messages.success(request, "Payment successful via Mobile Money.")
-    # notifications
-    send_order_email(order, subject_prefix="Order Paid")
-    send_sms(order.phone, f"TBSS: Payment received for order {order.order_number}. Thank you!")
 
-    # clear cart if any remnants
-    request.session["cart"] = {}
-    request.session.modified = True
+@csrf_exempt
+@require_POST
+def momo_sandbox(request):
+    """Local stand-in for the provider (MOMO_SANDBOX only).
 
-    return redirect("orders:success", order_number=order.order_number)
+    Accepts the prompt and, after ``delay`` seconds, calls back as if the
+    customer approved. Phone numbers ending in 0 decline and in 9 never
+    answer, so the failure and expiry paths can be tried too.
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "invalid JSON"}, status=400)
+    reference = f"SBX-{uuid.uuid4().hex[:12].upper()}"
+    phone = str(data.get("phone", ""))
+    momo_log.info("MoMo prompt %s to %s for GH₵ %s", reference, phone, data.get("amount"))
+    if not phone.endswith("9"):
+        payload = {
+            "external_id": data.get("external_id"),
+            "reference": reference,
+            "status": "FAILED" if phone.endswith("0") else "SUCCESSFUL",
+            "amount": data.get("amount"),
+            "currency": data.get("currency"),
+        }
+        delay = float(request.GET.get("delay", 3))
+        threading.Timer(delay, _sandbox_callback, args=(data.get("callback_url"), payload)).start()
+    return JsonResponse({"reference": reference, "status": "PENDING"}, status=202)
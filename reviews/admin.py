@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Review
+from .ratings import set_approval
 
 
 @admin.register(Review)
@@ -13,9 +14,11 @@ class ReviewAdmin(admin.ModelAdmin):
     ]
 
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
+        count = set_approval(queryset, True)
+        self.message_user(request, f"Approved {count} reviews.")
     approve_reviews.short_description = "Approve selected reviews"
 
     def unapprove_reviews(self, request, queryset):
-        queryset.update(is_approved=False)
+        count = set_approval(queryset, False)
+        self.message_user(request, f"Unapproved {count} reviews.")
     unapprove_reviews.short_description = "Unapprove selected reviews"
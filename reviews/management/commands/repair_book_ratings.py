@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from reviews.ratings import recompute_all
+
+
+class Command(BaseCommand):
+    help = "Recompute every book's review sum, count and average from the approved reviews."
+
+    def handle(self, *args, **options):
+        repaired = recompute_all()
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} book ratings."))
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:02
+
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def populate(apps, schema_editor):
+    Book = apps.get_model("catalog", "Book")
+    Review = apps.get_model("reviews", "Review")
+    rows = Review.objects.filter(is_approved=True).values("book_id").annotate(total=Sum("rating"), n=Count("pk")).order_by()
+    for row in rows:
+        Book.objects.filter(pk=row["book_id"]).update(
+            rating_sum=row["total"], rating_count=row["n"], rating=row["total"] / row["n"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+        ('catalog', '0012_book_rating_count_book_rating_sum'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_book_rating_count_book_rating_sum'),
+        ('reviews', '0002_populate_book_rating_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', 'is_approved', 'created_at'], name='reviews_rev_book_id_ab60b3_idx'),
+        ),
+    ]
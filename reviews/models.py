@@ -1,7 +1,10 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from catalog.models import Book
+from .ratings import apply_deltas, contribution
 
 
 class Review(models.Model):
@@ -16,15 +19,53 @@ class Review(models.Model):
     class Meta:
         ordering = ["-created_at"]
         unique_together = ("book", "user")
+        indexes = [models.Index(fields=["book", "is_approved", "created_at"])]
 
     def __str__(self):
         return f"{self.book.title} review by {self.user}"
 
+    def _rating_state(self):
+        # (book_id, (sum, count)) this review contributes to its book's aggregate.
+        return self.book_id, contribution(self.rating, self.is_approved)
+
+    def _stored_rating_state(self):
+        """The contribution of this review as stored, with the row locked.
+
+        Must run inside a transaction, so a concurrent edit of the same review
+        waits instead of computing its delta from the same old state.
+        """
+        if self._state.adding or not self.pk:
+            return None
+        old = (
+            Review.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values_list("book_id", "rating", "is_approved")
+            .first()
+        )
+        return (old[0], contribution(old[1], old[2])) if old else None
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # update book aggregate rating
-        agg = self.book.reviews.filter(is_approved=True).aggregate(avg=models.Avg("rating"))
-        avg = agg.get("avg") or 0
-        if self.book.rating != float(avg):
-            self.book.rating = float(avg)
-            self.book.save(update_fields=["rating"])
+        with transaction.atomic():
+            before = self._stored_rating_state()
+            super().save(*args, **kwargs)
+            book_id, (s, n) = self._rating_state()
+            deltas = {book_id: (s, n)}
+            if before:
+                book_id, (s, n) = before
+                ds, dn = deltas.get(book_id, (0, 0))
+                deltas[book_id] = (ds - s, dn - n)
+            apply_deltas(deltas)
+
+
+@receiver(pre_delete, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # Deletes run in a transaction, so the row stays locked until post_delete.
+    instance._rated = instance._stored_rating_state()
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    state = instance._rated
+    if state:
+        book_id, (s, n) = state
+        apply_deltas({book_id: (-s, -n)})
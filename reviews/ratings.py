@@ -0,0 +1,113 @@
+"""Per-book review aggregates.
+
+``Book.rating_sum`` and ``Book.rating_count`` cover approved reviews only
+and are moved by deltas in a single ``UPDATE`` whenever a review is
+created, edited, approved, unapproved or deleted; ``Book.rating`` is
+recomputed from them in the same statement. Nothing ever re-averages all of
+a book's reviews except ``recompute_all`` (the ``repair_book_ratings``
+command).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from catalog.models import Book
+from core.cache import bump_generation
+
+
+def contribution(rating, is_approved):
+    """What one review adds to its book's (sum, count)."""
+    return (rating, 1) if is_approved else (0, 0)
+
+
+def apply_deltas(deltas):
+    """Move each book's aggregate by ``deltas`` ({book_id: (sum_delta, count_delta)})."""
+    changed = False
+    for book_id, (sum_delta, count_delta) in sorted(deltas.items()):
+        if not (sum_delta or count_delta):
+            continue
+        new_sum = F("rating_sum") + sum_delta
+        new_count = F("rating_count") + count_delta
+        # SET expressions all see the row as it was, so rating uses the new totals.
+        Book.objects.filter(pk=book_id).update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            rating=Coalesce(Cast(new_sum, FloatField()) / NullIf(new_count, Value(0)), Value(0.0)),
+        )
+        changed = True
+    if changed:
+        transaction.on_commit(lambda: bump_generation("book"))
+
+
+def queryset_deltas(reviews, sign):
+    """Deltas for adding (``sign=1``) or removing (``sign=-1``) approved ``reviews``."""
+    deltas = defaultdict(lambda: (0, 0))
+    rows = reviews.filter(is_approved=True).values("book_id").annotate(total=Sum("rating"), n=Count("pk")).order_by()
+    for row in rows:
+        deltas[row["book_id"]] = (sign * row["total"], sign * row["n"])
+    return deltas
+
+
+def set_approval(reviews, is_approved):
+    """Bulk approve or unapprove ``reviews``, keeping the aggregates in step.
+
+    Returns the number of reviews whose approval changed.
+    """
+    with transaction.atomic():
+        ids = list(reviews.filter(is_approved=not is_approved).select_for_update().values_list("pk", flat=True))
+        if not ids:
+            return 0
+        changing = reviews.model.objects.filter(pk__in=ids)
+        if is_approved:
+            changing.update(is_approved=True)
+            apply_deltas(queryset_deltas(changing, 1))
+        else:
+            apply_deltas(queryset_deltas(changing, -1))
+            changing.update(is_approved=False)
+        transaction.on_commit(lambda: bump_generation("review"))
+    return len(ids)
+
+
+def rating_histogram(book):
+    """Star counts for ``book``'s approved reviews, 5 stars first, from one grouped query."""
+    from .models import Review
+
+    counts = dict(
+        Review.objects.filter(book=book, is_approved=True)
+        .values("rating")
+        .annotate(n=Count("pk"))
+        .order_by()
+        .values_list("rating", "n")
+    )
+    total = sum(counts.values())
+    return [
+        {"stars": stars, "count": counts.get(stars, 0), "percent": round(100 * counts.get(stars, 0) / total) if total else 0}
+        for stars in range(5, 0, -1)
+    ]
+
+
+def recompute_all():
+    """Rebuild every book's aggregate from one grouped query; return how many were wrong."""
+    from .models import Review
+
+    totals = {
+        row["book_id"]: (row["total"], row["n"])
+        for row in Review.objects.filter(is_approved=True)
+        .values("book_id")
+        .annotate(total=Sum("rating"), n=Count("pk"))
+        .order_by()
+    }
+    stale = []
+    for book in Book.objects.only("pk", "rating_sum", "rating_count", "rating"):
+        total, n = totals.get(book.pk, (0, 0))
+        rating = total / n if n else 0.0
+        if (book.rating_sum, book.rating_count) != (total, n) or abs(book.rating - rating) > 1e-9:
+            book.rating_sum, book.rating_count, book.rating = total, n, rating
+            stale.append(book)
+    with transaction.atomic():
+        Book.objects.bulk_update(stale, ["rating_sum", "rating_count", "rating"], batch_size=500)
+        if stale:
+            transaction.on_commit(lambda: bump_generation("book"))
+    return len(stale)
@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import ReviewsIndexView, add_review
+from .views import BookReviewsView, ReviewsIndexView, add_review
 
 app_name = "reviews"
 
 urlpatterns = [
     path("", ReviewsIndexView.as_view(), name="index"),
     path("add/<slug:slug>/", add_review, name="add"),
+    path("book/<slug:slug>/", BookReviewsView.as_view(), name="book"),
 ]
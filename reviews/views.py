@@ -1,12 +1,27 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
-from django.views.generic import ListView
+from django.views.generic import ListView, View
 
 from catalog.models import Book
+from core.cache import ConditionalGetMixin
 from orders.models import Order
 from .models import Review
 
+REVIEWS_PER_PAGE = 10
+
+
+def book_reviews_page(book, number):
+    """One page of ``book``'s approved reviews, newest first, users joined in."""
+    reviews = (
+        Review.objects.filter(book=book, is_approved=True)
+        .select_related("user")
+        .order_by("-created_at", "-pk")
+    )
+    return Paginator(reviews, REVIEWS_PER_PAGE).get_page(number)
+
 
 class ReviewsIndexView(ListView):
     template_name = "reviews/index.html"
@@ -17,6 +32,32 @@ class ReviewsIndexView(ListView):
         return Review.objects.select_related("book", "user").filter(is_approved=True)
 
 
+class BookReviewsView(ConditionalGetMixin, View):
+    """JSON pages of a book's reviews for the detail page's "More reviews" button."""
+
+    cache_generations = ("review",)
+    varies_per_visitor = False
+
+    def get(self, request, slug):
+        book = get_object_or_404(Book, slug=slug, is_active=True)
+        page = book_reviews_page(book, request.GET.get("page"))
+        return JsonResponse({
+            "reviews": [
+                {
+                    "rating": r.rating,
+                    "title": r.title,
+                    "body": r.body,
+                    "user": r.user.get_username(),
+                    "created_at": r.created_at.isoformat(),
+                }
+                for r in page
+            ],
+            "page": page.number,
+            "next_page": page.next_page_number() if page.has_next() else None,
+            "total": page.paginator.count,
+        })
+
+
 @login_required
 def add_review(request, slug):
     if request.method != "POST":